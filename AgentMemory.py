@@ -0,0 +1,265 @@
+import numpy as np
+
+# value of cells the agent has not seen yet
+UNKNOWN = -1
+
+# The agent's map of the cells it has seen.
+# cells is a (rows, cols) int8 array of entity types (UNKNOWN for unseen cells), known is the matching bool mask.
+# view is a memoryview of cells, view[(r, c)] is as fast as a dict lookup and is used in the agent's hot loops.
+# Supports the dict operations the agent used on its old memory dict: in, [], get, len and iteration over positions.
+# While a snapshot shares cells and known (shared is True) the next write copies them first.
+class AgentMemory:
+    def __init__(self, grid_size):
+        self.rows, self.cols = grid_size
+        self.set_arrays(np.full(grid_size, UNKNOWN, dtype=np.int8), np.zeros(grid_size, dtype=bool))
+        self.shared = False
+        self.count = 0
+        # bounding box of the known cells, [min_row, max_row] x [min_col, max_col]
+        self.bounds = None
+
+        # number of in-bounds 4-neighbours of every cell
+        self.neighbour_count = np.full(grid_size, 4, dtype=np.int8)
+        self.neighbour_count[0, :] -= 1
+        self.neighbour_count[-1, :] -= 1
+        self.neighbour_count[:, 0] -= 1
+        self.neighbour_count[:, -1] -= 1
+
+    def __contains__(self, pos):
+        row, col = pos
+        return 0 <= row < self.rows and 0 <= col < self.cols and self.view[row, col] != UNKNOWN
+
+    def __getitem__(self, pos):
+        if pos not in self:
+            raise KeyError(pos)
+        return self.view[pos]
+
+    def get(self, pos, default=None):
+        return self.view[pos] if pos in self else default
+
+    def __setitem__(self, pos, value):
+        self.write_window(pos[0], pos[1], np.array([[value]]))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for row, col in np.argwhere(self.known).tolist():
+            yield (row, col)
+
+    def items(self):
+        for pos in self:
+            yield pos, self.view[pos]
+
+    def set_arrays(self, cells, known):
+        self.cells = cells
+        self.known = known
+        self.view = memoryview(self.cells)
+        # the same cells by flat id row * cols + col, for GridAStar
+        self.flat = self.view.cast('b')
+
+    # memoryviews cannot be pickled or deep copied, they are made again from the arrays
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["view"], state["flat"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.set_arrays(self.cells, self.known)
+
+    # (cells, known, count, bounds) for restore, the arrays are shared until the next write
+    def snapshot(self):
+        self.shared = True
+        return self.cells, self.known, self.count, self.bounds
+
+    def restore(self, state):
+        cells, known, self.count, self.bounds = state
+        self.set_arrays(cells, known)
+        self.shared = True
+
+    def own(self):
+        if self.shared:
+            self.set_arrays(self.cells.copy(), self.known.copy())
+            self.shared = False
+
+    # writes a block of cells with its top left cell at (min_row, min_col)
+    def write_window(self, min_row, min_col, values):
+        rows, cols = values.shape
+        if rows == 0 or cols == 0:
+            return
+        self.own()
+        max_row, max_col = min_row + rows - 1, min_col + cols - 1
+        known = self.known[min_row:max_row + 1, min_col:max_col + 1]
+        self.count += known.size - int(np.count_nonzero(known))
+        known[...] = True
+        self.cells[min_row:max_row + 1, min_col:max_col + 1] = values
+
+        if self.bounds is None:
+            self.bounds = (min_row, max_row, min_col, max_col)
+        else:
+            r0, r1, c0, c1 = self.bounds
+            self.bounds = (min(r0, min_row), max(r1, max_row), min(c0, min_col), max(c1, max_col))
+
+    # slices of the known bounding box grown by margin cells, clipped to the grid
+    def region(self, margin=1):
+        if self.bounds is None:
+            return slice(0, 0), slice(0, 0)
+        r0, r1, c0, c1 = self.bounds
+        return (slice(max(0, r0 - margin), min(self.rows, r1 + margin + 1)),
+                slice(max(0, c0 - margin), min(self.cols, c1 + margin + 1)))
+
+    # number of known 4-neighbours of every cell of known (a sub array of the known mask)
+    @staticmethod
+    def count_known_neighbours(known):
+        counts = np.zeros(known.shape, dtype=np.int8)
+        counts[1:, :] += known[:-1, :]
+        counts[:-1, :] += known[1:, :]
+        counts[:, 1:] += known[:, :-1]
+        counts[:, :-1] += known[:, 1:]
+        return counts
+
+    # frontier cells: unknown cells next to at least one known cell
+    # returns rows, cols, number of unknown in-bounds neighbours and number of known neighbours of every frontier cell
+    def frontier(self):
+        # frontier cells are inside the known bounding box grown by one cell,
+        # their neighbours outside of it are unknown, so counting inside it is enough
+        rows, cols = self.region(margin=1)
+        known = self.known[rows, cols]
+        known_neighbours = self.count_known_neighbours(known)
+        unknown_neighbours = self.neighbour_count[rows, cols] - known_neighbours
+        is_frontier = ~known & (known_neighbours > 0)
+
+        frontier_rows, frontier_cols = np.nonzero(is_frontier)
+        return (frontier_rows + rows.start, frontier_cols + cols.start,
+                unknown_neighbours[is_frontier], known_neighbours[is_frontier])
+
+    # known cells with at least one unknown in-bounds neighbour
+    def border(self):
+        rows, cols = self.region(margin=1)
+        known = self.known[rows, cols]
+        unknown_neighbours = self.neighbour_count[rows, cols] - self.count_known_neighbours(known)
+        border_rows, border_cols = np.nonzero(known & (unknown_neighbours > 0))
+        return border_rows + rows.start, border_cols + cols.start
+
+
+# Frontier cells of an AgentMemory, kept up to date as the memory changes.
+# score is a (rows, cols) int8 array with the number of unknown in-bounds neighbours of every frontier cell
+# and -1 for other cells, counts[s] is the number of frontier cells with score s.
+# update() only looks at the changed window and the ring around it, ranked() walks rings around the agent
+# over score, so the best candidates cost the area around the agent that holds them, not the whole frontier.
+class FrontierSet:
+    def __init__(self, grid_size):
+        self.rows, self.cols = grid_size
+        self.score = np.full(grid_size, -1, dtype=np.int8)
+        self.view = memoryview(self.score)
+        self.counts = [0] * 5
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __contains__(self, pos):
+        row, col = pos
+        return 0 <= row < self.rows and 0 <= col < self.cols and self.view[row, col] >= 0
+
+    # like AgentMemory, the view is made again from score
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["view"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.view = memoryview(self.score)
+
+    # recompute the frontier from scratch
+    def rebuild(self, memory):
+        self.score[:] = -1
+        rows, cols, scores, _ = memory.frontier()
+        self.score[rows, cols] = scores
+        self.counts = np.bincount(scores, minlength=5).tolist()
+
+    # update after memory cells [min_row, max_row] x [min_col, max_col] were written
+    def update(self, memory, min_row, max_row, min_col, max_col):
+        # cells that can enter or leave the frontier: the window and the ring around it
+        r0, r1 = max(0, min_row - 1), min(self.rows, max_row + 2)
+        c0, c1 = max(0, min_col - 1), min(self.cols, max_col + 2)
+        # one more ring so that the neighbour counts of those cells are right
+        outer_r0, outer_c0 = max(0, r0 - 1), max(0, c0 - 1)
+        known = memory.known[outer_r0:min(self.rows, r1 + 1), outer_c0:min(self.cols, c1 + 1)]
+        inner = (slice(r0 - outer_r0, r1 - outer_r0), slice(c0 - outer_c0, c1 - outer_c0))
+
+        known_neighbours = memory.count_known_neighbours(known)[inner]
+        unknown_neighbours = memory.neighbour_count[r0:r1, c0:c1] - known_neighbours
+        new = np.where(~known[inner] & (known_neighbours > 0), unknown_neighbours, -1)
+
+        old = self.score[r0:r1, c0:c1]
+        for score in range(5):
+            self.counts[score] += int(np.count_nonzero(new == score)) - int(np.count_nonzero(old == score))
+        old[...] = new
+
+    # frontier cells as (dist, pos), best first, ranked by score (highest first) then by distance to location
+    # then by position, cells closer than 4 to last_scan_position lose 2 points like in the agent's old frontier search
+    # the cells come from rings of growing distance around location, a cell of a lower score met on a ring waits
+    # until the higher scores are used up (counts tells when), so the first k cells only cost the rings up to the
+    # k-th one; check is called before every ring, every 32 rows of a ring and every waiting cell, the agent passes
+    # its deadline check
+    def ranked(self, location, last_scan_position=None, check=None):
+        row, col = location
+        view = self.view
+
+        # cells near the last scan, with their lowered score
+        penalized = {}
+        if last_scan_position:
+            scan_row, scan_col = last_scan_position
+            for dr in range(-3, 4):
+                for dc in range(abs(dr) - 3, 4 - abs(dr)):
+                    r, c = scan_row + dr, scan_col + dc
+                    if 0 <= r < self.rows and 0 <= c < self.cols and view[r, c] >= 0:
+                        penalized[(r, c)] = view[r, c] - 2
+
+        # cells of every score, from 4 down to -2, not met on a ring yet, and the met ones waiting for their turn
+        left = {score: (self.counts[score] if score >= 0 else 0) for score in range(4, -3, -1)}
+        for score in penalized.values():
+            left[score + 2] -= 1
+            left[score] += 1
+        waiting = {score: [] for score in left}
+
+        level = 4
+        max_dist = max(row, self.rows - 1 - row) + max(col, self.cols - 1 - col)
+        for dist in range(max_dist + 1):
+            # the waiting cells of a score are all closer than this ring, they go first
+            while level >= -2 and not left[level]:
+                level -= 1
+                if level >= -2:
+                    for candidate in waiting[level]:
+                        if check:
+                            check()
+                        yield candidate
+                    waiting[level] = []
+            if level < -2:
+                return
+            if check:
+                check()
+
+            # the ring in position order
+            for r in range(max(0, row - dist), min(self.rows, row + dist + 1)):
+                if check and r % 32 == 0:
+                    check()
+                dc = dist - abs(r - row)
+                for c in ((col - dc, col + dc) if dc else (col,)):
+                    if not 0 <= c < self.cols:
+                        continue
+                    score = view[r, c]
+                    if score < 0:
+                        continue
+                    if penalized:
+                        score = penalized.get((r, c), score)
+                    left[score] -= 1
+                    if score == level:
+                        yield dist, (r, c)
+                    else:
+                        waiting[score].append((dist, (r, c)))
+
+        # every cell was met, only waiting ones are left
+        for score in range(level - 1, -3, -1):
+            yield from waiting[score]
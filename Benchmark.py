@@ -0,0 +1,305 @@
+import argparse
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from SpaceEnvironment import SpaceEnvironment
+from Spacecraft import Agent
+from Profiling import Profiler
+from Runner import GameRunner
+
+# Benchmarks of the environment and agent hot paths over grid sizes and entity densities, with fixed seeds
+# every case plays seeded episodes once with a Profiler attached and keeps snapshots of them, then times on its own:
+# initialize_env, find_safe_path queries and taking the 5 best exploration targets on the last state of the episodes,
+# choose_action, sense (after a SCAN), update_env and do_action of every allowed action type restored to the snapshots,
+# and the branch of a lookahead: restoring a snapshot the state has moved a step away from, then playing one step
+# results are microseconds per call, "<rows>x<cols>/<density>/<timer>"
+#
+# every measurement runs once per round and the rounds go over the whole suite, the first round is a warm-up and the
+# fastest of the other rounds counts; like in timeit the garbage collector is off during a round
+# The Profiler timers of the played episodes (choose_action, sense, select_new_target,
+# find_exploration_targets, do_action per action type, update_env) are means of one run, they are reported but not
+# compared against the baseline, the standalone timers above cover them
+#
+# usage: python Benchmark.py --save benchmark_baseline.json     records a baseline
+#        python Benchmark.py --baseline benchmark_baseline.json  compares against it, exits 1 on a regression
+#
+# timings depend on the machine, so no baseline is kept in the repository: record one on the machine the comparison
+# runs on, from the commit to compare against (e.g. git stash, --save, git stash pop, then --baseline), with nothing
+# else running
+
+GRIDS = [(20, 20), (100, 100), (500, 500)]
+# entities per grid cell, the default initialize_env counts are 15 entities on 400 cells
+DENSITIES = {"sparse": 0.01, "dense": 0.04}
+# share of every entity type, like the default counts 4 planets, 5 meteors, 2 stations, 2 nebulas and 2 radiation zones
+ENTITY_SHARES = {"num_planets": 4, "num_meteors": 5, "num_space_stations": 2, "num_nebulas": 2, "num_radiation_zones": 2}
+
+SEEDS = [0, 1, 2]
+# steps per episode, large grids are capped lower to keep the suite short
+MAX_TIMESTEPS = {20: 300, 100: 200, 500: 100}
+SAFE_PATH_QUERIES = 20
+# snapshots per episode that choose_action, sense, update_env and do_action are timed from
+SNAPSHOT_POINTS = 5
+# calls of the exploration targets per measurement, one call takes only microseconds
+TARGETS_CALLS = 20
+# timed rounds after the warm-up round
+ROUNDS = 5
+
+# a timer only counts as a regression when it is threshold times slower and more than MIN_DELTA_US slower
+THRESHOLD = 1.3
+MIN_DELTA_US = 5.0
+
+
+def entity_options(grid, density):
+    total = grid[0] * grid[1] * density
+    share_sum = sum(ENTITY_SHARES.values())
+    return {name: max(1, round(total * share / share_sum)) for name, share in ENTITY_SHARES.items()}
+
+
+def new_env(grid, options, seed):
+    env = SpaceEnvironment(grid=grid, percept_mode="array", seed=seed)
+    env.initialize_env(**options)
+    return env
+
+
+# One grid size and density: the played episodes and the measurements on them
+# items[timer] is a list of (setup, timed, number), setup runs before the measurement and is not timed,
+# timed is called number times and one call is what the timer reports
+class BenchmarkCase:
+    def __init__(self, grid, density):
+        self.name = f"{grid[0]}x{grid[1]}/{density}"
+        self.options = entity_options(grid, DENSITIES[density])
+        self.profiler = Profiler()
+        self.items = {"initialize_env": [], "find_safe_path query": [], "exploration targets top 5": [],
+                      "choose_action": [], "sense": [], "update_env": [], "restore and step": []}
+        for seed in SEEDS:
+            self.add_initialize(grid, seed)
+            self.add_episode(grid, seed)
+
+    def add_initialize(self, grid, seed):
+        env = SpaceEnvironment(grid=grid, percept_mode="array", seed=seed)
+        # the same layout every time
+        self.items["initialize_env"].append((lambda: env.rng.seed(seed), lambda: env.initialize_env(**self.options), 1))
+
+    def add_episode(self, grid, seed):
+        env = new_env(grid, self.options, seed)
+        agent_state = env.initial_agent_state()
+        agent = Agent({'resource_goals': env.resource_goals}, env.grid_size, location=env.starting_position, seed=seed)
+        observation = env.observation(agent_state)
+        result = env.do_action(agent_state, "SCAN")
+        agent.sense(result["agent_state"]["position"], observation, result["percepts"])
+
+        snapshots = []
+        # states where the agent can collect or dock, only the do_action timers of those two use them
+        collect_dock_snapshots = []
+        every = max(1, MAX_TIMESTEPS[grid[0]] // SNAPSHOT_POINTS)
+
+        self.profiler.attach(agent, env)
+        update_env = env.update_env
+
+        def snapshotting_update_env(agent_state):
+            update_env(agent_state)
+            if env.timestep % every == 0:
+                snapshots.append((env.snapshot(agent_state), agent.snapshot()))
+            elif len(collect_dock_snapshots) < SNAPSHOT_POINTS and (
+                    env.is_action_allowed(agent_state, "COLLECT") or env.is_action_allowed(agent_state, "DOCK")):
+                collect_dock_snapshots.append((env.snapshot(agent_state), agent.snapshot()))
+
+        # over the profiler's wrapper, so snapshots are not timed; detach removes both
+        env.update_env = snapshotting_update_env
+        GameRunner(env, agent, max_timesteps=MAX_TIMESTEPS[grid[0]], history=1).run(agent_state, observation)
+        self.profiler.detach()
+        last = (env.snapshot(agent_state), agent.snapshot())
+
+        # restores a snapshot and makes the copies the first changes after a restore would make
+        def restore(snapshot):
+            env.restore(snapshot[0], agent_state)
+            agent.restore(snapshot[1])
+            agent.memory.own()
+            agent.station_field.own()
+            agent.own_history()
+            env.own(agent_state)
+
+        # the environment only, for do_action and update_env
+        def restore_env(snapshot):
+            env.restore(snapshot[0], agent_state)
+            env.own(agent_state)
+
+        # restores a snapshot and plays one step from it, the copies and index fixes of a branch are part of it
+        def branch(snapshot):
+            env.restore(snapshot[0], agent_state)
+            agent.restore(snapshot[1])
+            action = agent.choose_action(observation, env.actions(agent_state))
+            result = env.do_action(agent_state, action)
+            if result["percepts"]:
+                agent.sense(agent_state["position"], observation, result["percepts"])
+            env.update_env(agent_state)
+
+        # queries from the last location to known cells, on the memory of the played episode
+        def restore_last():
+            restore(last)
+            agent.fuel = 100
+        rng = random.Random(seed)
+        known = list(agent.memory)
+        for i, goal in enumerate(rng.sample(known, min(SAFE_PATH_QUERIES, len(known)))):
+            self.items["find_safe_path query"].append((
+                restore_last if i == 0 else None,
+                lambda goal=goal: agent.find_safe_path(agent.location, goal, observation),
+                1))
+        self.items["exploration targets top 5"].append((
+            restore_last, lambda: list(itertools.islice(agent.find_exploration_targets(), 5)), TARGETS_CALLS))
+
+        for snapshot in snapshots:
+            # allowed actions and percepts come from the setup
+            step = {}
+
+            def before_choose(snapshot=snapshot, step=step):
+                restore(snapshot)
+                step["allowed"] = env.actions(agent_state)
+
+            def before_sense(snapshot=snapshot, step=step):
+                restore(snapshot)
+                step["percepts"] = env.do_action(agent_state, "SCAN")["percepts"]
+
+            self.items["choose_action"].append((before_choose, lambda step=step: agent.choose_action(observation, step["allowed"]), 1))
+            self.items["sense"].append((before_sense, lambda step=step: agent.sense(agent_state["position"], observation, step["percepts"]), 1))
+            self.items["update_env"].append((lambda snapshot=snapshot: restore_env(snapshot), lambda: env.update_env(agent_state), 1))
+            # the setup plays the first step, so the timed restore has that step to undo
+            self.items["restore and step"].append((lambda snapshot=snapshot: branch(snapshot),
+                                                   lambda snapshot=snapshot: branch(snapshot), 1))
+
+        # every action allowed in a snapshot, a timer per action type like the Profiler's "do_action <action>"
+        timed_actions = [(snapshot, None) for snapshot in snapshots]
+        timed_actions += [(snapshot, ("COLLECT", "DOCK")) for snapshot in collect_dock_snapshots]
+        for snapshot, only in timed_actions:
+            env.restore(snapshot[0], agent_state)
+            for action in env.actions(agent_state):
+                if only and action not in only:
+                    continue
+                self.items.setdefault(f"do_action {action}", []).append((
+                    lambda snapshot=snapshot: restore_env(snapshot),
+                    lambda action=action: env.do_action(agent_state, action),
+                    1))
+
+    # {timer: [seconds per call of every item]}
+    def run_round(self):
+        clock = time.perf_counter
+        times = {}
+        for name, items in self.items.items():
+            row = []
+            for setup, timed, number in items:
+                if setup:
+                    setup()
+                start = clock()
+                for _ in range(number):
+                    timed()
+                row.append((clock() - start) / number)
+            times[name] = row
+        return times
+
+
+# (results, episode): results are the fastest round of every timer and episode the Profiler timers of the played
+# episodes, both as {"<rows>x<cols>/<density>/<timer>": us}
+def run_suite(grids, densities, rounds=ROUNDS):
+    cases = [BenchmarkCase(grid, density) for grid in grids for density in densities]
+
+    best = {}
+    gc_was_enabled = gc.isenabled()
+    for round in range(rounds + 1):
+        for case in cases:
+            gc.collect()
+            gc.disable()
+            try:
+                times_of_round = case.run_round()
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+            for name, times in times_of_round.items():
+                key = f"{case.name}/{name}"
+                if round == 0 or not times:
+                    continue
+                best[key] = np.minimum(best[key], times) if key in best else np.array(times)
+    results = {key: float(times.mean()) * 1e6 for key, times in best.items()}
+
+    episode = {}
+    for case in cases:
+        for row in case.profiler.report().timer_rows():
+            episode[f"{case.name}/{row['name']}"] = row["mean_us"]
+    return results, episode
+
+
+# timers that are slower than the baseline beyond threshold, as (name, baseline us, current us)
+def find_regressions(results, baseline, threshold=THRESHOLD):
+    regressions = []
+    for name, us in results.items():
+        if name in baseline:
+            old = baseline[name]
+            if us > old * threshold and us - old > MIN_DELTA_US:
+                regressions.append((name, old, us))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = [f"{'benchmark':<52}{'us':>12}" + (f"{'baseline':>12}{'ratio':>8}" if baseline else "")]
+    for name, us in results.items():
+        line = f"{name:<52}{us:>12.1f}"
+        if baseline and name in baseline:
+            line += f"{baseline[name]:>12.1f}{us / baseline[name]:>8.2f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the environment and agent hot paths")
+    parser.add_argument("--grids", type=int, nargs="+", default=[rows for rows, _ in GRIDS], help="grid sizes to run")
+    parser.add_argument("--densities", nargs="+", choices=list(DENSITIES), default=list(DENSITIES))
+    parser.add_argument("--save", default=None, metavar="PATH", help="write the results as the new baseline")
+    parser.add_argument("--baseline", default=None, metavar="PATH", help="compare against this baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slowdown ratio that fails the run")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="timed rounds over the suite")
+    args = parser.parse_args()
+
+    # timed out benchmark episodes are expected, keep the runner from dumping its history
+    logging.getLogger("Runner").setLevel(logging.CRITICAL)
+
+    results, episode = run_suite([(size, size) for size in args.grids], args.densities, args.rounds)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print(format_results(results, baseline))
+    print("\nprofiled episodes, one run, not compared against the baseline")
+    print(format_results(episode))
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "seeds": SEEDS,
+                "rounds": args.rounds,
+                "results": results,
+                "episode": episode,
+            }, f, indent=1)
+        print(f"\nbaseline written to {args.save}")
+
+    if baseline:
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, old, us in regressions:
+            print(f"REGRESSION {name}: {old:.1f}us -> {us:.1f}us ({us / old:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"\nno regression beyond {args.threshold}x")
@@ -0,0 +1,182 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from SpaceEnvironment import SpaceEnvironment
+from Runner import GameRunner, is_success
+from Spacecraft import Agent
+from Tracing import TraceRecorder
+
+# Headless evaluation of the agent over many seeded episodes
+# every episode is a SpaceEnvironment + Agent game played by the GameRunner of main.py, without logging its failures
+# episodes are split into chunks and run on a process pool
+#
+# usage: python Evaluation.py --episodes 10000 --workers 8 --out evaluation_results
+# writes episodes.csv (one row per episode) and summary.csv (aggregate table) to the out directory
+# --trace DIR also records every step of every chunk of episodes to a binary trace in DIR (see Tracing.py)
+
+EPISODE_FIELDS = [
+    "seed", "success", "reached_end", "is_map_covered", "is_resources_met",
+    "died", "out_of_fuel", "timed_out", "timesteps",
+    "decision_ms_mean", "decision_ms_p50", "decision_ms_p99",
+    "fuel", "health", "coverage", "water", "minerals", "oxygen", "fallbacks",
+]
+
+# fields that are summarized as a rate over all episodes
+RATE_FIELDS = ["success", "reached_end", "is_map_covered", "is_resources_met", "died", "out_of_fuel", "timed_out"]
+# fields that are summarized with mean/p50/p99/min/max
+STAT_FIELDS = ["timesteps", "decision_ms_mean", "decision_ms_p50", "decision_ms_p99",
+               "fuel", "health", "coverage", "water", "minerals", "oxygen", "fallbacks"]
+
+
+# runs one episode and returns its outcome as a dict with EPISODE_FIELDS keys
+# budget_ms is passed on to Agent.choose_action, fallbacks counts the decisions that ran out of it
+# a Profiling.Profiler given as profiler is attached to the agent and environment for the episode,
+# a Tracing.TraceRecorder given as recorder records its steps
+def run_episode(seed, grid=(20,20), max_timesteps=1000, env_options=None, agent_options=None, budget_ms=None,
+                profiler=None, recorder=None):
+    # environment and agent have their own generators, so an episode only depends on its seed
+    env = SpaceEnvironment(grid=grid, percept_mode="array", seed=seed)
+    env.initialize_env(**(env_options or {}))
+    if recorder:
+        recorder.attach(env, seed)
+    agent_state = env.initial_agent_state()
+    agent = Agent({'resource_goals': env.resource_goals}, env.grid_size, location=env.starting_position, seed=seed,
+                  **(agent_options or {}))
+    if profiler:
+        profiler.attach(agent, env)
+
+    # the agent reads its state and the environment through this view, do_action updates agent_state in place
+    observation = env.observation(agent_state)
+
+    # initial scan
+    result = env.do_action(agent_state, "SCAN")
+    agent_state = result["agent_state"]
+    agent.sense(agent_state["position"], observation, result["percepts"])
+
+    runner = GameRunner(env, agent, max_timesteps=max_timesteps, history=0, budget_ms=budget_ms, log_failures=False)
+    game_status = runner.run(agent_state, observation)
+
+    if profiler:
+        profiler.detach()
+    if recorder:
+        recorder.detach()
+    decision_ms = np.array(runner.decision_times or [0.0]) * 1000
+    return {
+        "seed": seed,
+        "success": is_success(game_status),
+        "reached_end": agent_state["position"] == env.end_position,
+        "is_map_covered": game_status["is_map_covered"],
+        "is_resources_met": game_status["is_resources_met"],
+        "died": agent_state["health"] <= 0,
+        "out_of_fuel": agent_state["fuel"] <= 0,
+        "timed_out": not game_status["is_game_over"],
+        "timesteps": env.timestep,
+        "decision_ms_mean": float(decision_ms.mean()),
+        "decision_ms_p50": float(np.percentile(decision_ms, 50)),
+        "decision_ms_p99": float(np.percentile(decision_ms, 99)),
+        "fuel": agent_state["fuel"],
+        "health": agent_state["health"],
+        "coverage": agent_state["covered_map_percentage"],
+        "water": agent_state["collected_resources"]["water"],
+        "minerals": agent_state["collected_resources"]["minerals"],
+        "oxygen": agent_state["collected_resources"]["oxygen"],
+        "fallbacks": agent.fallback_count,
+    }
+
+
+# with a trace_dir every chunk writes its steps to the trace trace_dir/seeds_<first seed>
+def _run_chunk(args):
+    seeds, grid, max_timesteps, env_options, agent_options, budget_ms, trace_dir = args
+    recorder = TraceRecorder(os.path.join(trace_dir, f"seeds_{seeds[0]}")) if trace_dir else None
+    try:
+        return [run_episode(seed, grid, max_timesteps, env_options, agent_options, budget_ms, recorder=recorder)
+                for seed in seeds]
+    finally:
+        if recorder:
+            recorder.close()
+
+
+# runs num_episodes episodes with seeds first_seed, first_seed+1, ...
+# returns the list of episode outcomes ordered by seed
+def evaluate(num_episodes, workers=None, first_seed=0, grid=(20,20), max_timesteps=1000,
+             env_options=None, chunk_size=50, agent_options=None, budget_ms=None, trace_dir=None):
+    seeds = list(range(first_seed, first_seed + num_episodes))
+    chunks = [(seeds[i:i + chunk_size], grid, max_timesteps, env_options, agent_options, budget_ms, trace_dir)
+              for i in range(0, len(seeds), chunk_size)]
+
+    if workers == 1:
+        results = [_run_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_chunk, chunks))
+    return [episode for chunk in results for episode in chunk]
+
+
+# aggregate table, one row per metric
+def summarize(episodes):
+    rows = [{"metric": "episodes", "mean": len(episodes)}]
+    for field in RATE_FIELDS:
+        values = np.array([episode[field] for episode in episodes], dtype=float)
+        rows.append({"metric": field + "_rate", "mean": values.mean()})
+    for field in STAT_FIELDS:
+        values = np.array([episode[field] for episode in episodes], dtype=float)
+        rows.append({
+            "metric": field,
+            "mean": values.mean(),
+            "p50": np.percentile(values, 50),
+            "p99": np.percentile(values, 99),
+            "min": values.min(),
+            "max": values.max(),
+        })
+    return rows
+
+
+def write_tables(episodes, summary, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "episodes.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=EPISODE_FIELDS)
+        writer.writeheader()
+        writer.writerows(episodes)
+    with open(os.path.join(out_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["metric", "mean", "p50", "p99", "min", "max"])
+        writer.writeheader()
+        writer.writerows(summary)
+
+
+def format_summary(summary):
+    lines = [f"{'metric':<22}{'mean':>12}{'p50':>12}{'p99':>12}{'min':>12}{'max':>12}"]
+    for row in summary:
+        values = "".join(f"{row[k]:>12.4g}" if k in row else f"{'':>12}" for k in ["mean", "p50", "p99", "min", "max"])
+        lines.append(f"{row['metric']:<22}{values}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the agent over many seeded episodes")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cpus)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--grid", type=int, nargs=2, default=[20, 20], metavar=("ROWS", "COLS"))
+    parser.add_argument("--max-timesteps", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--planner", choices=["astar", "dstar", "hierarchical"], default="astar")
+    parser.add_argument("--budget-ms", type=float, default=None, help="time budget of every decision")
+    parser.add_argument("--trace", default=None, metavar="DIR", help="record binary step traces to DIR")
+    parser.add_argument("--out", default="evaluation_results")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    episodes = evaluate(args.episodes, args.workers, args.seed, tuple(args.grid), args.max_timesteps,
+                        chunk_size=args.chunk_size, agent_options={"planner": args.planner}, budget_ms=args.budget_ms,
+                        trace_dir=args.trace)
+    elapsed = time.perf_counter() - start_time
+
+    summary = summarize(episodes)
+    write_tables(episodes, summary, args.out)
+    print(format_summary(summary))
+    print(f"\n{len(episodes)} episodes in {elapsed:.1f}s, tables written to {args.out}/")
@@ -0,0 +1,749 @@
+import heapq
+import math
+import time
+from array import array
+from collections import deque
+
+import numpy as np
+
+from AgentMemory import UNKNOWN
+
+
+# raised by the searches below when their deadline (a time.perf_counter() value) has passed
+class DeadlineExceeded(Exception):
+    pass
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise DeadlineExceeded()
+
+# Planned path to one goal, reused on the next steps while nothing it depends on changes.
+# path holds the cells still to walk (path[0] is the next cell), costs the move cost of each of them.
+# watch is the set of path cells and their neighbours, a cost change on one of them drops the path.
+class PathCache:
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self.start = None
+        self.goal = None
+        self.path = deque()
+        self.path_cells = set()
+        self.costs = deque()
+        self.remaining_cost = 0
+        self.watch = set()
+        self.monsters_on_path = set()
+
+    # path is the list find_safe_path returned from start to goal, costs the move cost of each cell
+    def store(self, start, goal, path, costs, monster_coords):
+        self.start = start
+        self.goal = goal
+        self.path = deque(path)
+        self.path_cells = set(path)
+        self.costs = deque(costs)
+        self.remaining_cost = sum(costs)
+        self.watch = set(path)
+        for row, col in path:
+            self.watch.update([(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)])
+        self.monsters_on_path = self.find_monsters_on_path(monster_coords)
+
+    # remaining path from start to goal, or None when there is no valid cached path
+    def get(self, start, goal, fuel, monster_coords):
+        if goal != self.goal or not self.path:
+            return None
+
+        if start != self.start:
+            # the agent walked one step of the path
+            if start == self.path[0]:
+                cell = self.path.popleft()
+                self.path_cells.discard(cell)
+                self.monsters_on_path.discard(cell)
+                self.remaining_cost -= self.costs.popleft()
+                self.start = start
+            else:
+                self.invalidate()
+                return None
+
+        # the path has to fit in the fuel left and no meteor may have moved on or off it
+        if not self.path or self.remaining_cost > fuel or self.find_monsters_on_path(monster_coords) != self.monsters_on_path:
+            self.invalidate()
+            return None
+        return self.path
+
+    def find_monsters_on_path(self, monster_coords):
+        if len(monster_coords) < len(self.path_cells):
+            return {pos for pos in monster_coords if pos in self.path_cells}
+        return {pos for pos in self.path_cells if pos in monster_coords}
+
+    # drop the path if one of cells is on it or next to it
+    def cells_changed(self, cells):
+        if self.path and any(cell in self.watch for cell in cells):
+            self.invalidate()
+
+    # watch is only replaced by store, never changed, so it is shared with the snapshot
+    def snapshot(self):
+        return (self.start, self.goal, tuple(self.path), tuple(self.costs), self.remaining_cost,
+                self.watch, frozenset(self.monsters_on_path))
+
+    def restore(self, state):
+        start, goal, path, costs, self.remaining_cost, self.watch, monsters_on_path = state
+        self.start = start
+        self.goal = goal
+        self.path = deque(path)
+        self.path_cells = set(path)
+        self.costs = deque(costs)
+        self.monsters_on_path = set(monsters_on_path)
+
+
+# D* Lite (Koenig and Likhachev) on the agent's grid.
+# Searches backwards from the goal and keeps g/rhs values between calls, so when the agent moves
+# or move costs change only the affected part of the search is repaired.
+# cost(pos) is the cost of moving into pos, it has to be told about every change with update_cells.
+# While a snapshot shares g, rhs and the open list (shared is True) the next change copies them first.
+class DStarLite:
+    def __init__(self, grid_size, cost, start, goal):
+        self.rows, self.cols = grid_size
+        self.cost = cost
+        self.start = start
+        self.goal = goal
+        self.km = 0
+        self.g = {}
+        self.rhs = {goal: 0}
+        # open list: heap of (key, pos) with stale entries skipped, open_keys holds the current key of each open cell
+        self.open = []
+        self.open_keys = {}
+        # cells whose move cost changed and whose neighbours compute_shortest_path has not updated yet
+        self.changed = []
+        self.expanded = 0
+        self.shared = False
+        self.push(goal, (self.heuristic(start, goal), 0))
+
+    def heuristic(self, a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    def neighbors(self, pos):
+        row, col = pos
+        for next_pos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            if 0 <= next_pos[0] < self.rows and 0 <= next_pos[1] < self.cols:
+                yield next_pos
+
+    def calculate_key(self, pos):
+        value = min(self.g.get(pos, math.inf), self.rhs.get(pos, math.inf))
+        return (value + self.heuristic(self.start, pos) + self.km, value)
+
+    def push(self, pos, key):
+        self.open_keys[pos] = key
+        heapq.heappush(self.open, (key, pos))
+
+    def top_key(self):
+        while self.open:
+            key, pos = self.open[0]
+            if self.open_keys.get(pos) == key:
+                return key
+            heapq.heappop(self.open)
+        return (math.inf, math.inf)
+
+    def update_vertex(self, pos):
+        if pos != self.goal:
+            self.rhs[pos] = min(self.cost(next_pos) + self.g.get(next_pos, math.inf) for next_pos in self.neighbors(pos))
+        self.open_keys.pop(pos, None)
+        if self.g.get(pos, math.inf) != self.rhs.get(pos, math.inf):
+            self.push(pos, self.calculate_key(pos))
+
+    # stops with DeadlineExceeded once deadline has passed, the next call carries on where it stopped
+    def compute_shortest_path(self, deadline=None):
+        self.own()
+        # moving into a changed cell got cheaper or more expensive from each of its neighbours
+        changed = self.changed
+        while changed:
+            check_deadline(deadline)
+            for prev_pos in self.neighbors(changed.pop()):
+                self.update_vertex(prev_pos)
+
+        while self.top_key() < self.calculate_key(self.start) or \
+                self.rhs.get(self.start, math.inf) != self.g.get(self.start, math.inf):
+            if self.expanded % 8 == 0:
+                check_deadline(deadline)
+            key, pos = heapq.heappop(self.open)
+            del self.open_keys[pos]
+            self.expanded += 1
+
+            new_key = self.calculate_key(pos)
+            if key < new_key:
+                self.push(pos, new_key)
+            elif self.g.get(pos, math.inf) > self.rhs.get(pos, math.inf):
+                self.g[pos] = self.rhs[pos]
+                for prev_pos in self.neighbors(pos):
+                    self.update_vertex(prev_pos)
+            else:
+                self.g[pos] = math.inf
+                self.update_vertex(pos)
+                for prev_pos in self.neighbors(pos):
+                    self.update_vertex(prev_pos)
+
+    def move_start(self, start):
+        if start != self.start:
+            self.km += self.heuristic(self.start, start)
+            self.start = start
+
+    # the move cost of every cell in cells changed, the search is repaired by the next compute_shortest_path
+    def update_cells(self, cells):
+        if cells:
+            self.own()
+            self.changed.extend(cells)
+
+    # cheapest path from start to goal (start excluded), [] if it costs more than max_cost
+    def path(self, max_cost=math.inf, deadline=None):
+        self.compute_shortest_path(deadline)
+        if self.g.get(self.start, math.inf) > max_cost:
+            return []
+
+        path = []
+        current = self.start
+        while current != self.goal:
+            current = min(self.neighbors(current), key=lambda pos: self.cost(pos) + self.g.get(pos, math.inf))
+            if self.g.get(current, math.inf) == math.inf or len(path) > self.rows * self.cols:
+                return []
+            path.append(current)
+        return path
+
+    # state for restore, the containers are shared until the next change
+    def snapshot(self):
+        self.shared = True
+        return self.start, self.km, self.g, self.rhs, self.open, self.open_keys, self.changed
+
+    def restore(self, state):
+        self.start, self.km, self.g, self.rhs, self.open, self.open_keys, self.changed = state
+        self.shared = True
+
+    def own(self):
+        if self.shared:
+            self.g = dict(self.g)
+            self.rhs = dict(self.rhs)
+            self.open = list(self.open)
+            self.open_keys = dict(self.open_keys)
+            self.changed = list(self.changed)
+            self.shared = False
+
+
+# Cost of the cheapest path from every cell to the nearest station, kept up to date as move costs change.
+# dist[pos] is that cost (pos excluded like in find_path_costs, inf when it is above max_cost),
+# next_cell[pos] is the first step of the path and station[pos] the station it ends on.
+# cost(pos) is the cost of moving into pos, update_cells has to be told about every cell whose cost changed.
+# While a snapshot shares its arrays and dicts (shared is True) the next change copies them first.
+class StationDistanceField:
+    def __init__(self, grid_size, cost, max_cost=100):
+        self.rows, self.cols = grid_size
+        self.cost = cost
+        self.max_cost = max_cost
+        # float32 holds the integer distances up to 2**24 and inf exactly, at half the size of float64
+        self.dist = np.full(grid_size, math.inf, dtype=np.float32)
+        self.view = memoryview(self.dist)
+        self.next_cell = {}
+        self.station = {}
+        self.stations = set()
+        # cost of every cell the distances were computed with
+        self.costs = {}
+        # (dist, pos) cells whose distance still has to be passed on by propagate
+        self.frontier = []
+        # cells whose path went through a changed cell, propagate takes their distance away
+        self.orphans = []
+        self.shared = False
+        # cells expanded or orphaned by all propagate calls so far
+        self.expanded = 0
+
+    def __getitem__(self, pos):
+        return self.view[pos]
+
+    # memoryviews cannot be pickled or deep copied, the view is made again from dist
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["view"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.view = memoryview(self.dist)
+
+    def neighbors(self, pos):
+        row, col = pos
+        for next_pos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            if 0 <= next_pos[0] < self.rows and 0 <= next_pos[1] < self.cols:
+                yield next_pos
+
+    def add_stations(self, stations):
+        for pos in stations:
+            if pos not in self.stations:
+                self.own()
+                self.stations.add(pos)
+                self.view[pos] = 0
+                self.next_cell.pop(pos, None)
+                self.station[pos] = pos
+                heapq.heappush(self.frontier, (0, pos))
+
+    # Dijkstra backwards from the cells of frontier, the distances are only complete once it returns
+    # stops with DeadlineExceeded once deadline has passed, the next call carries on where it stopped
+    def propagate(self, deadline=None):
+        if self.frontier or self.orphans:
+            self.own()
+        dist = self.view
+        frontier = self.frontier
+        orphans = self.orphans
+        steps = 0
+        try:
+            # the orphans lose their distance first, the cells whose path goes through them follow,
+            # their other neighbours pass their distance on again so the orphans find their best remaining path
+            while orphans:
+                steps += 1
+                if steps % 8 == 0:
+                    check_deadline(deadline)
+                pos = orphans.pop()
+                # orphaned twice by changes of two update_cells calls
+                if pos not in self.next_cell:
+                    continue
+                dist[pos] = math.inf
+                del self.next_cell[pos]
+                del self.station[pos]
+                for prev_pos in self.neighbors(pos):
+                    if self.next_cell.get(prev_pos) == pos:
+                        orphans.append(prev_pos)
+                    elif dist[prev_pos] != math.inf:
+                        heapq.heappush(frontier, (dist[prev_pos], prev_pos))
+
+            while frontier:
+                steps += 1
+                if steps % 8 == 0:
+                    check_deadline(deadline)
+                cost, pos = heapq.heappop(frontier)
+                # entries of cells that got a lower distance or lost theirs since they were pushed
+                if cost != dist[pos]:
+                    continue
+                move_cost = self.costs[pos] = self.cost(pos)
+                new_cost = cost + move_cost
+                if new_cost > self.max_cost:
+                    continue
+                for prev_pos in self.neighbors(pos):
+                    if new_cost < dist[prev_pos]:
+                        dist[prev_pos] = new_cost
+                        self.next_cell[prev_pos] = pos
+                        self.station[prev_pos] = self.station[pos]
+                        heapq.heappush(frontier, (new_cost, prev_pos))
+        finally:
+            self.expanded += steps
+
+    # the move cost of some of cells changed, propagate has to be called afterwards; cells is emptied as they are checked
+    # cells whose path goes through a changed cell become orphans, the changed cells pass their distance on again,
+    # an entry of a cell orphaned afterwards is skipped by propagate like any outdated one
+    # raises DeadlineExceeded once deadline has passed, the cells left are checked by the next call
+    def update_cells(self, cells, deadline=None):
+        while cells:
+            if len(cells) % 8 == 0:
+                check_deadline(deadline)
+            pos = cells.pop()
+            if pos not in self.costs or self.cost(pos) == self.costs[pos]:
+                continue
+            self.own()
+            self.orphans.extend(prev_pos for prev_pos in self.neighbors(pos) if self.next_cell.get(prev_pos) == pos)
+            if self.view[pos] != math.inf:
+                heapq.heappush(self.frontier, (self.view[pos], pos))
+
+    # cheapest path from start to its station (start excluded)
+    def path(self, start):
+        path = []
+        current = start
+        while current in self.next_cell:
+            current = self.next_cell[current]
+            path.append(current)
+        return path
+
+    # state for restore, the containers are shared until the next change
+    def snapshot(self):
+        self.shared = True
+        return self.dist, self.next_cell, self.station, self.stations, self.costs, self.frontier, self.orphans
+
+    def restore(self, state):
+        self.dist, self.next_cell, self.station, self.stations, self.costs, self.frontier, self.orphans = state
+        self.view = memoryview(self.dist)
+        self.shared = True
+
+    def own(self):
+        if self.shared:
+            self.dist = self.dist.copy()
+            self.view = memoryview(self.dist)
+            self.next_cell = dict(self.next_cell)
+            self.station = dict(self.station)
+            self.stations = set(self.stations)
+            self.costs = dict(self.costs)
+            self.frontier = list(self.frontier)
+            self.orphans = list(self.orphans)
+            self.shared = False
+
+
+# move cost by cell type for GridAStar, the cost model of Agent.cell_cost without meteors
+# the last entry is the cost of UNKNOWN (-1) cells
+TERRAIN_COSTS = np.array([1, 1, 1, 20, 1, 2, 20, 1, 1, 1], dtype=np.int16)
+# cost of the border cells around the grid, more than any fuel, the largest cost the 'H' costs array holds
+BLOCKED = (1 << 16) - 1
+# grids up to this many cells (with the border) keep the GridAStar buffers in lists, larger ones in typed arrays
+LIST_CELLS = 1 << 20
+
+
+# A* over flat cell ids with the agent's cost model, for find_safe_path.
+# The grid is stored with a border of BLOCKED cells, cell (row, col) has id (row + 1) * width + col + 1,
+# so neighbours are id +- 1 and id +- width without bound checks.
+# costs, g, parent and stamp are allocated once. g and parent of a cell are only valid when its stamp is from the
+# current search: every search takes two new stamp values, seen and closed = seen + 1, so a new search does not clear
+# anything. Reading single elements from Python is fastest from a list and several times slower from a numpy array,
+# but a list takes 8 bytes per entry. Up to LIST_CELLS cells they are lists (32 MB at the limit), larger grids get
+# typed arrays of 12 bytes per cell: at 2000x2000 48 MB instead of 128 MB, and long searches (about 1 ms) are about
+# 50% slower, reading an array element makes a new int object. Costs and g are 16 bit, max_cost has to stay
+# below BLOCKED.
+# Heap entries are priority * size + id, ordered like the (priority, (row, col)) tuples of the old search,
+# so it finds the same paths.
+class GridAStar:
+    def __init__(self, grid_size):
+        self.rows, self.cols = grid_size
+        self.width = self.cols + 2
+        self.size = (self.rows + 2) * self.width
+        # terrain cost of every cell, kept up to date by set_cells
+        self.costs = self.buffer('H', BLOCKED)
+        inner = self.buffer('H', 1, self.cols)
+        for row in range(self.rows):
+            start = (row + 1) * self.width + 1
+            self.costs[start:start + self.cols] = inner
+        self.g = self.buffer('H')
+        self.parent = self.buffer('i')
+        self.stamp = self.buffer('I')
+        self.generation = 0
+        # cells expanded and heap entries pushed by all searches so far
+        self.expanded = 0
+        self.pushes = 0
+
+    # size entries of value, a list or an array of typecode
+    def buffer(self, typecode, value=0, size=None):
+        size = self.size if size is None else size
+        if self.size <= LIST_CELLS:
+            return [value] * size
+        return array(typecode, [value]) * size
+
+    # memory cells [min_row, min_row + rows) x [min_col, min_col + cols) were set to values
+    def set_cells(self, min_row, min_col, values):
+        for row, row_costs in enumerate(TERRAIN_COSTS[values].tolist()):
+            start = (min_row + row + 1) * self.width + min_col + 1
+            self.costs[start:start + len(row_costs)] = row_costs if self.size <= LIST_CELLS else array('H', row_costs)
+
+    # cheapest path from start to goal (start excluded) that costs at most max_cost, [] if there is none
+    # cells is the agent's memory as a flat memoryview, meteors in monsters cost 20 on known cells
+    # raises DeadlineExceeded once deadline has passed
+    def search(self, start, goal, cells, monsters, max_cost, deadline=None):
+        width, size = self.width, self.size
+        costs, g, parent, stamp = self.costs, self.g, self.parent, self.stamp
+        if self.generation + 2 > 0xFFFFFFFF:
+            self.stamp = stamp = self.buffer('I')
+            self.generation = 0
+        # stamps below seen are from older searches
+        seen = self.generation + 1
+        closed = self.generation = seen + 1
+        goal_row, goal_col = goal[0] + 1, goal[1] + 1
+        start_id = (start[0] + 1) * width + start[1] + 1
+        goal_id = goal_row * width + goal_col
+        # current < above when current is on or above the goal row, current >= below when on or below it
+        above = (goal_row + 1) * width
+        below = goal_row * width
+
+        g[start_id] = 0
+        stamp[start_id] = seen
+        frontier = [(abs(start[0] - goal[0]) + abs(start[1] - goal[1])) * size + start_id]
+        push, pop = heapq.heappush, heapq.heappop
+        expanded = popped = 0
+        # meteors on known cells that would otherwise cost 1, reset after the search
+        raised = []
+        try:
+            for count, (row, col) in enumerate(monsters):
+                if count % 64 == 0:
+                    check_deadline(deadline)
+                cell_id = (row + 1) * width + col + 1
+                if costs[cell_id] == 1 and cells[row * self.cols + col] != UNKNOWN:
+                    costs[cell_id] = 20
+                    raised.append(cell_id)
+
+            while frontier:
+                entry = pop(frontier)
+                popped += 1
+                current = entry % size
+                if stamp[current] == closed:
+                    continue
+                if current == goal_id:
+                    break
+                stamp[current] = closed
+                expanded += 1
+                if deadline is not None and expanded % 8 == 0:
+                    check_deadline(deadline)
+
+                cost = g[current]
+                h = entry // size - cost
+                col = current % width
+
+                # the four neighbours, unrolled, their heuristic is h + 1 when moving away from the goal and h - 1 otherwise
+                next_id = current - width
+                new_cost = cost + costs[next_id]
+                if new_cost <= max_cost and (stamp[next_id] < seen or new_cost < g[next_id]):
+                    g[next_id] = new_cost
+                    parent[next_id] = current
+                    stamp[next_id] = seen
+                    push(frontier, (new_cost + (h + 1 if current < above else h - 1)) * size + next_id)
+
+                next_id = current + width
+                new_cost = cost + costs[next_id]
+                if new_cost <= max_cost and (stamp[next_id] < seen or new_cost < g[next_id]):
+                    g[next_id] = new_cost
+                    parent[next_id] = current
+                    stamp[next_id] = seen
+                    push(frontier, (new_cost + (h + 1 if current >= below else h - 1)) * size + next_id)
+
+                next_id = current - 1
+                new_cost = cost + costs[next_id]
+                if new_cost <= max_cost and (stamp[next_id] < seen or new_cost < g[next_id]):
+                    g[next_id] = new_cost
+                    parent[next_id] = current
+                    stamp[next_id] = seen
+                    push(frontier, (new_cost + (h + 1 if col <= goal_col else h - 1)) * size + next_id)
+
+                next_id = current + 1
+                new_cost = cost + costs[next_id]
+                if new_cost <= max_cost and (stamp[next_id] < seen or new_cost < g[next_id]):
+                    g[next_id] = new_cost
+                    parent[next_id] = current
+                    stamp[next_id] = seen
+                    push(frontier, (new_cost + (h + 1 if col >= goal_col else h - 1)) * size + next_id)
+        finally:
+            for cell_id in raised:
+                costs[cell_id] = 1
+        self.expanded += expanded
+        self.pushes += popped + len(frontier)
+
+        if stamp[goal_id] < seen or goal_id == start_id:
+            return []
+        path = []
+        current = goal_id
+        while current != start_id:
+            row, col = divmod(current, width)
+            path.append((row - 1, col - 1))
+            current = parent[current]
+        path.reverse()
+        return path
+
+
+# Hierarchical planner in the style of HPA* (Botea, Mueller and Schaeffer) on the agent's grid.
+# The grid is split into cluster_size x cluster_size clusters, neighbouring clusters are connected by
+# entrances at fixed cells on both sides of their common border. The costs between the entrances of a
+# cluster are computed inside the cluster and only recomputed after one of its cells changed cost,
+# so a long route is searched over the entrances and only its first leg is turned into cells.
+# cost(pos) is the cost of moving into pos, update_cells has to be told about every cell whose cost changed.
+class HierarchicalPlanner:
+    def __init__(self, grid_size, cost, cluster_size=10):
+        self.rows, self.cols = grid_size
+        self.cost = cost
+        self.cluster_size = cluster_size
+
+        # entrance cells of every cluster, and for every entrance cell the entrance cells across the border
+        self.entrances = {}
+        self.across = {}
+        for row in range(0, self.rows, cluster_size):
+            for col in range(0, self.cols, cluster_size):
+                self.entrances[self.cluster_of((row, col))] = []
+        for row in range(0, self.rows, cluster_size):
+            for col in range(0, self.cols, cluster_size):
+                end_row, end_col = min(self.rows, row + cluster_size), min(self.cols, col + cluster_size)
+                # border with the cluster on the right and with the cluster below
+                if end_col < self.cols:
+                    for r in self.crossings(row, end_row):
+                        self.add_entrance((r, end_col - 1), (r, end_col))
+                if end_row < self.rows:
+                    for c in self.crossings(col, end_col):
+                        self.add_entrance((end_row - 1, c), (end_row, c))
+
+        # entrance -> {other entrance of its cluster: cost}, and the move costs they were computed with per cluster
+        self.edges = {}
+        self.cell_costs = {}
+        self.dirty = set(self.entrances)
+        self.expanded = 0
+
+    def cluster_of(self, pos):
+        return (pos[0] // self.cluster_size, pos[1] // self.cluster_size)
+
+    # rows (or cols) in [start, end) where a border gets entrances, three on long borders and one on short ones
+    def crossings(self, start, end):
+        length = end - start
+        if length >= 6:
+            return [start + length // 5, start + length // 2, end - 1 - length // 5]
+        return [start + length // 2]
+
+    def add_entrance(self, a, b):
+        for pos, other in [(a, b), (b, a)]:
+            if pos not in self.across:
+                self.across[pos] = []
+                self.entrances[self.cluster_of(pos)].append(pos)
+            self.across[pos].append(other)
+
+    # the move cost of some of cells changed, cells is emptied as they are checked
+    # raises DeadlineExceeded once deadline has passed, the cells left are checked by the next call
+    def update_cells(self, cells, deadline=None):
+        while cells:
+            if len(cells) % 8 == 0:
+                check_deadline(deadline)
+            pos = cells.pop()
+            cluster = self.cluster_of(pos)
+            if cluster not in self.dirty and self.cost(pos) != self.cell_costs[cluster][pos]:
+                self.dirty.add(cluster)
+
+    # move costs of the cells of cluster, with its entrance costs recomputed first if they are out of date
+    # raises DeadlineExceeded once deadline has passed, the cluster stays dirty until all its edges are rebuilt
+    def refresh(self, cluster, deadline=None):
+        if cluster in self.dirty:
+            row, col = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+            costs = {}
+            for r in range(row, min(self.rows, row + self.cluster_size)):
+                for c in range(col, min(self.cols, col + self.cluster_size)):
+                    costs[(r, c)] = self.cost((r, c))
+
+            for entrance in self.entrances[cluster]:
+                check_deadline(deadline)
+                dist, _ = self.search_cluster(entrance, costs, self.entrances[cluster], deadline=deadline)
+                self.edges[entrance] = {other: dist[other] for other in self.entrances[cluster]
+                                        if other != entrance and other in dist}
+            self.cell_costs[cluster] = costs
+            self.dirty.discard(cluster)
+        return self.cell_costs[cluster]
+
+    # Dijkstra from start over the cells of costs until every cell of targets is reached, returns (cost_so_far, came_from)
+    # with reverse it runs backwards: cost_so_far is the cost of reaching start and came_from the next cell toward it
+    # raises DeadlineExceeded once deadline has passed
+    def search_cluster(self, start, costs, targets, reverse=False, deadline=None):
+        remaining = set(targets)
+        remaining.discard(start)
+        frontier = [(0, start)]
+        came_from = {start: None}
+        cost_so_far = {start: 0}
+        popped = 0
+        while frontier and remaining:
+            cost, current = heapq.heappop(frontier)
+            if cost > cost_so_far[current]:
+                continue
+            popped += 1
+            if deadline is not None and popped % 8 == 0:
+                check_deadline(deadline)
+            remaining.discard(current)
+            row, col = current
+            for next_pos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+                if next_pos not in costs:
+                    continue
+                new_cost = cost + (costs[current] if reverse else costs[next_pos])
+                if next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]:
+                    cost_so_far[next_pos] = new_cost
+                    came_from[next_pos] = current
+                    heapq.heappush(frontier, (new_cost, next_pos))
+        return cost_so_far, came_from
+
+    # first cells of the cheapest route from start to goal over the entrances that costs at most max_cost,
+    # up to the first entrance it goes through (the whole path when start and goal share a cluster and
+    # the direct path is the cheapest), [] if there is no such route
+    # raises DeadlineExceeded once deadline has passed, the clusters refreshed until then are kept
+    def first_leg(self, start, goal, max_cost, deadline=None):
+        if start == goal or abs(start[0] - goal[0]) + abs(start[1] - goal[1]) > max_cost:
+            return []
+        start_cluster, goal_cluster = self.cluster_of(start), self.cluster_of(goal)
+        same_cluster = [goal] if start_cluster == goal_cluster else []
+        from_start, start_came_from = self.search_cluster(start, self.refresh(start_cluster, deadline),
+                                                          self.entrances[start_cluster] + same_cluster, deadline=deadline)
+        to_goal, goal_next = self.search_cluster(goal, self.refresh(goal_cluster, deadline),
+                                                 self.entrances[goal_cluster], reverse=True, deadline=deadline)
+
+        def heuristic(pos):
+            return abs(pos[0] - goal[0]) + abs(pos[1] - goal[1])
+
+        # heap entries are (priority, reaches goal, pos, cost), the goal entry is (cost, True, goal, cost)
+        frontier = []
+        cost_so_far = {}
+        came_from = {}
+        goal_cost, goal_from = math.inf, None
+        if start_cluster == goal_cluster and goal in from_start and from_start[goal] <= max_cost:
+            goal_cost, goal_from = from_start[goal], start
+            heapq.heappush(frontier, (goal_cost, True, goal, goal_cost))
+        for entrance in self.entrances[start_cluster]:
+            if entrance in from_start and from_start[entrance] + heuristic(entrance) <= max_cost:
+                cost_so_far[entrance] = from_start[entrance]
+                came_from[entrance] = start
+                heapq.heappush(frontier, (from_start[entrance] + heuristic(entrance), False, entrance, from_start[entrance]))
+
+        found = False
+        while frontier:
+            _, is_goal, current, cost = heapq.heappop(frontier)
+            if is_goal:
+                if cost == goal_cost:
+                    found = True
+                    break
+                continue
+            if cost > cost_so_far[current]:
+                continue
+            self.expanded += 1
+            check_deadline(deadline)
+
+            cluster = self.cluster_of(current)
+            self.refresh(cluster, deadline)
+            if cluster == goal_cluster and current in to_goal:
+                new_cost = cost + to_goal[current]
+                if new_cost < goal_cost and new_cost <= max_cost:
+                    goal_cost, goal_from = new_cost, current
+                    heapq.heappush(frontier, (new_cost, True, goal, new_cost))
+
+            neighbours = list(self.edges[current].items())
+            neighbours.extend((other, self.cost(other)) for other in self.across[current])
+            for next_pos, edge_cost in neighbours:
+                new_cost = cost + edge_cost
+                # the heuristic is a lower bound, entrances from which the goal is out of reach are dropped
+                priority = new_cost + heuristic(next_pos)
+                if (next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]) and priority <= max_cost:
+                    cost_so_far[next_pos] = new_cost
+                    came_from[next_pos] = current
+                    heapq.heappush(frontier, (priority, False, next_pos, new_cost))
+        if not found:
+            return []
+
+        route = [goal]
+        current = goal_from
+        while current != start:
+            route.append(current)
+            current = came_from[current]
+        route.append(start)
+        route.reverse()
+
+        # turn the route into cells until the first entrance that is not the start cell
+        leg = []
+        for a, b in zip(route, route[1:]):
+            if self.cluster_of(a) != self.cluster_of(b):
+                leg.append(b)
+            elif a == start:
+                current = b
+                cells = []
+                while current != start:
+                    cells.append(current)
+                    current = start_came_from[current]
+                leg.extend(reversed(cells))
+            elif b == goal:
+                current = a
+                while current != goal:
+                    current = goal_next[current]
+                    leg.append(current)
+            else:
+                _, inner_came_from = self.search_cluster(a, self.cell_costs[self.cluster_of(a)], [b], deadline=deadline)
+                cells = []
+                current = b
+                while current != a:
+                    cells.append(current)
+                    current = inner_came_from[current]
+                leg.extend(reversed(cells))
+            if leg:
+                break
+        return leg
@@ -0,0 +1,224 @@
+import argparse
+import time
+
+# Optional timers and counters on the hot paths of Agent and SpaceEnvironment
+# Profiler.attach(agent, env) wraps the profiled methods on those two instances only,
+# detach() removes the wrappers again, so agents and environments that are not profiled run the plain methods
+# times are time.perf_counter_ns() and inclusive: select_new_target contains the find_safe_path calls it makes
+#
+# usage: python Profiling.py --episodes 50 --grid 100 100
+# prints the aggregate report over the episodes
+
+# profiled agent methods; the searches find_safe_path, find_path_costs, find_nearest_frontier and the station field's
+# propagate are profiled as well with the cells they expanded (and the heap pushes of find_safe_path)
+AGENT_METHODS = ["choose_action", "sense", "select_new_target"]
+# agent methods that return a lazy iterator, their time is the time spent consuming it
+AGENT_ITERATOR_METHODS = ["find_exploration_targets"]
+
+
+# timers and counters of one episode
+# calls[name] and time_ns[name] are the number of calls and their total time, max_ns[name] the slowest call,
+# counters[name] are totals of other quantities like the nodes expanded by the searches
+class EpisodeStats:
+    def __init__(self):
+        self.calls = {}
+        self.time_ns = {}
+        self.max_ns = {}
+        self.counters = {}
+        self.episodes = 1
+
+    def add_time(self, name, ns):
+        if name in self.calls:
+            self.calls[name] += 1
+            self.time_ns[name] += ns
+            if ns > self.max_ns[name]:
+                self.max_ns[name] = ns
+        else:
+            self.calls[name] = 1
+            self.time_ns[name] = ns
+            self.max_ns[name] = ns
+
+    def add_count(self, name, amount):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # adds the timers and counters of other to this one
+    def merge(self, other):
+        for name, calls in other.calls.items():
+            if name in self.calls:
+                self.calls[name] += calls
+                self.time_ns[name] += other.time_ns[name]
+                self.max_ns[name] = max(self.max_ns[name], other.max_ns[name])
+            else:
+                self.calls[name] = calls
+                self.time_ns[name] = other.time_ns[name]
+                self.max_ns[name] = other.max_ns[name]
+        for name, amount in other.counters.items():
+            self.add_count(name, amount)
+        self.episodes += other.episodes
+
+    # one row per timer, slowest total first
+    def timer_rows(self):
+        rows = []
+        for name, calls in self.calls.items():
+            rows.append({
+                "name": name,
+                "calls": calls,
+                "calls_per_episode": calls / self.episodes,
+                "total_ms": self.time_ns[name] / 1e6,
+                "mean_us": self.time_ns[name] / calls / 1e3,
+                "max_us": self.max_ns[name] / 1e3,
+            })
+        rows.sort(key=lambda row: -row["total_ms"])
+        return rows
+
+    def format(self):
+        lines = [f"{'timer':<28}{'calls':>10}{'per ep':>10}{'total ms':>12}{'mean us':>10}{'max us':>10}"]
+        for row in self.timer_rows():
+            lines.append(f"{row['name']:<28}{row['calls']:>10}{row['calls_per_episode']:>10.1f}"
+                         f"{row['total_ms']:>12.2f}{row['mean_us']:>10.1f}{row['max_us']:>10.1f}")
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'counter':<28}{'total':>10}{'per ep':>10}")
+            for name, amount in sorted(self.counters.items()):
+                lines.append(f"{name:<28}{amount:>10}{amount / self.episodes:>10.1f}")
+        return "\n".join(lines)
+
+
+# Collects one EpisodeStats per attach() call
+# episodes is the list of finished and current episode stats, report() merges them
+class Profiler:
+    def __init__(self):
+        self.episodes = []
+        self.stats = None
+        self.wrapped = []
+
+    # starts a new episode and wraps the methods of agent and env (either can be None)
+    def attach(self, agent=None, env=None):
+        self.detach()
+        self.stats = EpisodeStats()
+        self.episodes.append(self.stats)
+        if agent is not None:
+            for name in AGENT_METHODS:
+                self.wrap(agent, name, self.timed(name, getattr(agent, name)))
+            for name in AGENT_ITERATOR_METHODS:
+                self.wrap(agent, name, self.timed_iterator(name, getattr(agent, name)))
+            astar, field = agent.astar, agent.station_field
+            self.wrap(agent, "find_safe_path", self.timed_search("find_safe_path", agent.find_safe_path, [
+                ("find_safe_path expanded", astar, "expanded"), ("find_safe_path pushes", astar, "pushes")]))
+            self.wrap(agent, "find_path_costs", self.timed_search("find_path_costs", agent.find_path_costs, [
+                ("find_path_costs expanded", agent, "path_costs_expanded")]))
+            self.wrap(agent, "find_nearest_frontier", self.timed_search("find_nearest_frontier", agent.find_nearest_frontier, [
+                ("find_nearest_frontier expanded", agent, "frontier_search_expanded")]))
+            self.wrap(field, "propagate", self.timed_search("station_field propagate", field.propagate, [
+                ("station_field expanded", field, "expanded")]))
+        if env is not None:
+            self.wrap(env, "do_action", self.timed_action(env.do_action))
+            self.wrap(env, "update_env", self.timed("update_env", env.update_env))
+        return self.stats
+
+    # removes the wrappers, the stats of the episode are kept
+    def detach(self):
+        for obj, name in self.wrapped:
+            obj.__dict__.pop(name, None)
+        self.wrapped = []
+
+    # stats merged over all episodes
+    def report(self):
+        total = EpisodeStats()
+        total.episodes = 0
+        for stats in self.episodes:
+            total.merge(stats)
+        return total
+
+    def wrap(self, obj, name, wrapper):
+        # the instance attribute hides the class method until detach removes it
+        setattr(obj, name, wrapper)
+        if (obj, name) not in self.wrapped:
+            self.wrapped.append((obj, name))
+
+    def timed(self, name, method):
+        stats = self.stats
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats.add_time(name, clock() - start)
+        return wrapper
+
+    # one call is the creation of the iterator and every next() on it, recorded once it is used up or closed
+    # (islice and list drop it right after the last item they take), the time between the items is not counted
+    def timed_iterator(self, name, method):
+        stats = self.stats
+        clock = time.perf_counter_ns
+
+        def consume(iterator, elapsed):
+            try:
+                while True:
+                    start = clock()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += clock() - start
+                    yield item
+            finally:
+                stats.add_time(name, elapsed)
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            iterator = iter(method(*args, **kwargs))
+            return consume(iterator, clock() - start)
+        return wrapper
+
+    # a search with counters, every (counter name, obj, attribute) of counters counts how much the running total
+    # obj.attribute grew during the call
+    def timed_search(self, name, method, counters):
+        stats = self.stats
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            before = [getattr(obj, attribute) for _, obj, attribute in counters]
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats.add_time(name, clock() - start)
+                for (counter, obj, attribute), old in zip(counters, before):
+                    stats.add_count(counter, getattr(obj, attribute) - old)
+        return wrapper
+
+    # do_action with one timer per action type
+    def timed_action(self, method):
+        stats = self.stats
+        clock = time.perf_counter_ns
+
+        def wrapper(agent_state, action):
+            start = clock()
+            try:
+                return method(agent_state, action)
+            finally:
+                stats.add_time("do_action " + action, clock() - start)
+        return wrapper
+
+
+if __name__ == "__main__":
+    from Evaluation import run_episode
+
+    parser = argparse.ArgumentParser(description="Profile the agent over seeded episodes")
+    parser.add_argument("--episodes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--grid", type=int, nargs=2, default=[20, 20], metavar=("ROWS", "COLS"))
+    parser.add_argument("--max-timesteps", type=int, default=1000)
+    parser.add_argument("--planner", choices=["astar", "dstar", "hierarchical"], default="astar")
+    parser.add_argument("--budget-ms", type=float, default=None, help="time budget of every decision")
+    args = parser.parse_args()
+
+    profiler = Profiler()
+    for seed in range(args.seed, args.seed + args.episodes):
+        run_episode(seed, tuple(args.grid), args.max_timesteps, agent_options={"planner": args.planner},
+                    budget_ms=args.budget_ms, profiler=profiler)
+    print(profiler.report().format())
@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+from collections import deque
+
+# Game loop of main.py without the per step prints, also the loop of Evaluation.run_episode
+# steps are logged on the "Runner" logger: DEBUG for every step, INFO for the start and the result,
+# nothing is shown unless the caller configures logging (main.py --verbose)
+# the last history steps are kept as plain tuples in a ring buffer and only formatted when the game fails,
+# a failed game (lost, timed out or crashed) logs them at ERROR level, unless log_failures is False
+# (a timed out or lost game is an expected outcome in Evaluation, a crash is always logged)
+# record_path streams one compact JSON line per step
+
+logger = logging.getLogger("Runner")
+
+# fields of a step, in the order of the ring buffer tuples and of the JSONL records
+STEP_FIELDS = ["timestep", "action", "position", "fuel", "health", "coverage", "target", "reason", "decision_ms"]
+
+
+# a game is won when it is over with the map covered and the resources collected
+def is_success(game_status):
+    return game_status["is_game_over"] and game_status["is_map_covered"] and game_status["is_resources_met"]
+
+
+# budget_ms is passed on to Agent.choose_action, decision_times holds the time of every decision in seconds
+class GameRunner:
+    def __init__(self, env, agent, max_timesteps=None, history=50, record_path=None, budget_ms=None,
+                 log_failures=True):
+        self.env = env
+        self.agent = agent
+        self.max_timesteps = max_timesteps
+        self.history = deque(maxlen=history)
+        self.record_path = record_path
+        self.budget_ms = budget_ms
+        self.log_failures = log_failures
+        self.total_decision_time = 0.0
+        self.decision_times = []
+
+    # plays the game to its end, returns the last game status of env.is_game_over
+    # observation is the env.observation(agent_state) the agent sensed with so far, a new one is made without it
+    def run(self, agent_state, observation=None):
+        env, agent = self.env, self.agent
+        observation = observation or env.observation(agent_state)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        record = open(self.record_path, "w") if self.record_path else None
+        logger.info("start %s, end %s, resource goals %s, mapping goal %s%%",
+                    env.starting_position, env.end_position, env.resource_goals, env.mapping_goal_percentage)
+
+        game_status = env.is_game_over(agent_state)
+        try:
+            while not game_status["is_game_over"] and (self.max_timesteps is None or env.timestep < self.max_timesteps):
+                allowed_actions = env.actions(agent_state)
+
+                start_time = time.perf_counter()
+                action = agent.choose_action(observation, allowed_actions, self.budget_ms)
+                decision_time = time.perf_counter() - start_time
+                self.total_decision_time += decision_time
+                self.decision_times.append(decision_time)
+
+                result = env.do_action(agent_state, action)
+                agent_state = result["agent_state"]
+                if result["percepts"]:
+                    agent.sense(agent_state["position"], observation, result["percepts"])
+
+                step = (env.timestep, action, agent_state["position"], agent_state["fuel"], agent_state["health"],
+                        agent_state["covered_map_percentage"], agent.current_target, agent.last_decision_reason,
+                        decision_time * 1000)
+                self.history.append(step)
+                if debug:
+                    logger.debug(self.format_step(step))
+                if record:
+                    record.write(json.dumps(dict(zip(STEP_FIELDS, step)), separators=(",", ":")) + "\n")
+
+                env.update_env(agent_state)
+                game_status = env.is_game_over(agent_state)
+        except Exception:
+            logger.exception("game crashed at timestep %s", env.timestep)
+            self.dump_history()
+            raise
+        finally:
+            if record:
+                record.close()
+
+        if is_success(game_status):
+            logger.info("mission complete after %s timesteps", env.timestep)
+        elif self.log_failures:
+            logger.error("game failed after %s timesteps: %s, fuel %s, health %s", env.timestep, game_status,
+                         agent_state["fuel"], agent_state["health"])
+            self.dump_history()
+        return game_status
+
+    # logs the steps of the ring buffer at ERROR level
+    def dump_history(self):
+        logger.error("last %s steps:\n%s", len(self.history), "\n".join(self.format_step(step) for step in self.history))
+
+    @staticmethod
+    def format_step(step):
+        timestep, action, position, fuel, health, coverage, target, reason, decision_ms = step
+        return (f"t={timestep} {action} pos={position} fuel={fuel} health={health} coverage={coverage:.2f}% "
+                f"target={target} reason={reason!r} decision={decision_ms:.3f}ms")
@@ -1,13 +1,19 @@
+import itertools
 import math
 import numpy as np
 import random
+from collections.abc import MutableSet
+from types import MappingProxyType
 # Imoprtant for agent code!!
 # agent_state is the dic {"position":x,"fuel":x,"health":x, "collected_resources":x, "covered_map_percentage":x,"explored_cells":x }
 # position is tuple row and col (1,2)
 # both health and fuel are int
 # collected_resources is the dic {"water":x, "minerals": x, "oxygen": x} where the values are int
 # covered_map_percentage is float
-# explored_cells is set of every explored cell (1,2)
+# explored_cells is set of every explored cell (1,2), initial_agent_state() uses an ExploredCells set
+# percept_mode of the environment decides how SCAN percepts are returned
+# "dicts" (default) is a list of {"position": pos, "entity_type": entity_type}
+# "array" is a ScanWindow, a read-only view of the scanned part of the grid
 
 # constants for entities to be mapped on the grid
 EMPTY = 0
@@ -20,11 +26,248 @@ RADIATION_ZONE = 6
 UNEXPLORED = 7
 END = 8
 
+# entity types the agent has to stay away from
+HAZARD_TYPES = (METEOR, RADIATION_ZONE)
+
+# every action, the index of an action is its integer code in VecSpaceEnvironment and in Tracing records
+ACTIONS = ["SCAN", "UP", "DOWN", "LEFT", "RIGHT", "COLLECT", "DOCK"]
+
+# percepts of a SCAN in "array" percept mode
+# window is a read-only view of the grid (no copy), origin is the grid position of window[0, 0]
+# the view changes with the grid, copy it if it is needed after the next action
+class ScanWindow:
+    def __init__(self, window, origin):
+        self.window = window
+        self.origin = origin
+
+    def __len__(self):
+        return self.window.size
+
+    def __iter__(self):
+        # same percepts as the "dicts" mode
+        row, col = self.origin
+        for (r, c), entity_type in np.ndenumerate(self.window):
+            yield {"position": (row + r, col + c), "entity_type": entity_type}
+
+    # every scanned position
+    def positions(self):
+        row, col = self.origin
+        rows, cols = self.window.shape
+        return itertools.product(range(row, row + rows), range(col, col + cols))
+
+# What the agent sees of an environment and of its agent_state, shared with the agent instead of copied into it
+# the properties read the live agent_state and environment, so one Observation stays valid for a whole episode
+# (as long as do_action keeps updating the same agent_state dict), nothing is copied per step
+# resources and resource_goals are read-only proxies, hazards is the environment's own set of meteor and
+# radiation positions (read it, never change it), grid is a read-only view of the grid
+class Observation:
+    def __init__(self, env, agent_state):
+        self.env = env
+        self.agent_state = agent_state
+        self.resources = MappingProxyType(agent_state["collected_resources"])
+        self.resource_goals = MappingProxyType(env.resource_goals)
+        self.hazards = env.hazards
+        self._grid = None
+        self._grid_view = None
+
+    @property
+    def position(self):
+        return self.agent_state["position"]
+
+    @property
+    def fuel(self):
+        return self.agent_state["fuel"]
+
+    @property
+    def health(self):
+        return self.agent_state["health"]
+
+    @property
+    def covered_map_percentage(self):
+        return self.agent_state["covered_map_percentage"]
+
+    @property
+    def grid(self):
+        # initialize_env replaces the grid array, the view is only made again then
+        if self._grid is not self.env.grid:
+            self._grid = self.env.grid
+            self._grid_view = self._grid.view()
+            self._grid_view.flags.writeable = False
+        return self._grid_view
+
+    @property
+    def end_position(self):
+        return self.env.end_position
+
+    @property
+    def mapping_goal_percentage(self):
+        return self.env.mapping_goal_percentage
+
+    @property
+    def station_positions(self):
+        return [station["position"] for station in self.env.space_stations]
+
+    # read-only planet on position or None
+    def planet_at(self, position):
+        planet = self.env.planet_at(position)
+        return MappingProxyType(planet) if planet else None
+
+    def actions(self):
+        return self.env.actions(self.agent_state)
+
+# set of explored cells backed by a (H, W) bool array
+# works like the old set of tuples, len() is O(1) because the count is kept up to date
+# while a snapshot shares mask (shared is True) the next change copies it first
+class ExploredCells(MutableSet):
+    def __init__(self, grid_size, cells=()):
+        self.mask = np.zeros(grid_size, dtype=bool)
+        self.count = 0
+        self.shared = False
+        for cell in cells:
+            self.add(cell)
+
+    @classmethod
+    def from_mask(cls, mask):
+        explored = cls(mask.shape)
+        explored.mask[:] = mask
+        explored.count = int(np.count_nonzero(mask))
+        return explored
+
+    def __contains__(self, cell):
+        row, col = cell
+        return 0 <= row < self.mask.shape[0] and 0 <= col < self.mask.shape[1] and bool(self.mask[row, col])
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for row, col in np.argwhere(self.mask).tolist():
+            yield (row, col)
+
+    def __repr__(self):
+        return f"ExploredCells({self.count} of {self.mask.size} cells)"
+
+    def add(self, cell):
+        if not self.mask[cell]:
+            self.own()
+            self.mask[cell] = True
+            self.count += 1
+
+    def discard(self, cell):
+        if cell in self:
+            self.own()
+            self.mask[cell] = False
+            self.count -= 1
+
+    def update(self, cells):
+        for cell in cells:
+            self.add(cell)
+
+    # mark every cell of the window, rows and cols are inclusive like in do_action
+    def mark_window(self, min_row, max_row, min_col, max_col):
+        self.own()
+        window = self.mask[min_row:max_row + 1, min_col:max_col + 1]
+        self.count += window.size - int(np.count_nonzero(window))
+        window[...] = True
+
+    def percentage(self):
+        return (self.count / self.mask.size) * 100
+
+    # (mask, count) for restore, mask is shared until the next change
+    def snapshot(self):
+        self.shared = True
+        return self.mask, self.count
+
+    def restore(self, state):
+        self.mask, self.count = state
+        self.shared = True
+
+    def own(self):
+        if self.shared:
+            self.mask = self.mask.copy()
+            self.shared = False
+
+# pool of the free cells of the grid for O(1) random sampling
+# cell ids (row * cols + col) of free cells are packed in cells[:size]
+# slot[cell] is the index of cell in cells, or -1 when the cell is occupied
+# occupying a cell swaps the last free cell into its slot
+# while a snapshot shares cells and slot (shared is True) the next change copies them first
+class FreeCellPool:
+    def __init__(self, grid_size):
+        self.cols = grid_size[1]
+        self.cells = np.arange(grid_size[0] * grid_size[1], dtype=np.int32)
+        self.slot = np.arange(grid_size[0] * grid_size[1], dtype=np.int32)
+        self.size = len(self.cells)
+        self.shared = False
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, position):
+        return self.slot[position[0] * self.cols + position[1]] >= 0
+
+    def remove(self, position):
+        cell = position[0] * self.cols + position[1]
+        i = self.slot[cell]
+        if i < 0:
+            return
+        self.own()
+        self.size -= 1
+        last = self.cells[self.size]
+        self.cells[i] = last
+        self.slot[last] = i
+        self.cells[self.size] = cell
+        self.slot[cell] = -1
+
+    def add(self, position):
+        cell = position[0] * self.cols + position[1]
+        if self.slot[cell] >= 0:
+            return
+        self.own()
+        self.cells[self.size] = cell
+        self.slot[cell] = self.size
+        self.size += 1
+
+    def sample(self, rng):
+        if self.size == 0:
+            raise ValueError("no empty position left on the grid")
+        cell = int(self.cells[rng.randrange(self.size)])
+        return divmod(cell, self.cols)
+
+    # (cells, slot, size) for restore, the arrays are shared until the next change
+    def snapshot(self):
+        self.shared = True
+        return self.cells, self.slot, self.size
+
+    def restore(self, state):
+        self.cells, self.slot, self.size = state
+        self.shared = True
+
+    def own(self):
+        if self.shared:
+            self.cells = self.cells.copy()
+            self.slot = self.slot.copy()
+            self.shared = False
+
+# state saved by SpaceEnvironment.snapshot(), only read by restore()
+class EnvSnapshot:
+    pass
+
 class SpaceEnvironment:
-    def __init__(self, grid=(20,20)):
+    # seed seeds the environment's own random generator (self.rng), None seeds it randomly
+    def __init__(self, grid=(20,20), percept_mode="dicts", seed=None):
+        self.rng = random.Random(seed)
+        if percept_mode not in ["dicts", "array"]:
+            raise ValueError(f"unknown percept_mode {percept_mode!r}")
+        self.percept_mode = percept_mode
         self.grid_size = grid  
-        self.grid = np.full(grid, 0)
+        # one byte per cell like VecSpaceEnvironment, a snapshot copy of a 1000x1000 grid is 1 MB
+        self.grid = np.full(grid, EMPTY, dtype=np.int8)
         self.occupied_positions = set()
+        self.free_cells = FreeCellPool(grid)
+        # grid and occupied_positions are shared with a snapshot, the next change copies them first
+        self.grid_shared = False
+        self.occupied_shared = False
 
         # entity containers
         self.planets = []
@@ -32,6 +275,11 @@ class SpaceEnvironment:
         self.space_stations = []
         self.nebulas = []
         self.radiation_zones = []
+        # entity type -> {position: [entities on that position]}
+        self.entity_index = {PLANET:{}, METEOR:{}, SPACE_STATION:{}, NEBULA:{}, RADIATION_ZONE:{}}
+        # positions with a meteor or a radiation zone, kept up to date with entity_index
+        # the set object is never replaced, observations share it
+        self.hazards = set()
 
         # game info
         self.timestep = 0
@@ -51,14 +299,22 @@ class SpaceEnvironment:
                       num_nebulas=2,
                       num_radiation_zones=2,
                       mapping_goal_percentage=70.0,
-                      resource_goals=None):
+                      resource_goals=None,
+                      seed=None):
+        # reseed, so the same seed always gives the same episode
+        if seed is not None:
+            self.rng.seed(seed)
+
         # reset env
-        self.grid = np.full(self.grid.shape, EMPTY, dtype=int)
+        self.grid = np.full(self.grid.shape, EMPTY, dtype=np.int8)
+        self.grid_shared = False
         self.planets = []
         self.meteors = []
         self.space_stations = []
         self.nebulas = []
         self.radiation_zones = []
+        self.entity_index = {PLANET:{}, METEOR:{}, SPACE_STATION:{}, NEBULA:{}, RADIATION_ZONE:{}}
+        self.hazards.clear()
         self.timestep = 0
 
         # goals
@@ -67,17 +323,19 @@ class SpaceEnvironment:
 
         # reset occupied positions
         self.occupied_positions = set()
+        self.occupied_shared = False
+        self.free_cells = FreeCellPool(self.grid_size)
 
         # agent position 
         if agent_position:
             self.starting_position = agent_position
         else:
-            start_row = random.randint(0, self.grid_size[0]-1)
-            start_col = random.randint(0, self.grid_size[1]-1)
+            start_row = self.rng.randint(0, self.grid_size[0]-1)
+            start_col = self.rng.randint(0, self.grid_size[1]-1)
             self.starting_position = (start_row, start_col)
 
         # add agent to grid
-        self.occupied_positions.add(self.starting_position)
+        self.occupy(self.starting_position)
         self.grid[self.starting_position] = AGENT
 
         # end position
@@ -87,7 +345,7 @@ class SpaceEnvironment:
             self.end_position = self.get_ranom_empty_position()
         
         # add end position to grid
-        self.occupied_positions.add(self.end_position)
+        self.occupy(self.end_position)
         self.grid[self.end_position] = END
 
         # Generating entities
@@ -98,11 +356,12 @@ class SpaceEnvironment:
             planet = {
                 "type":PLANET,
                 "position":position,
-                "resource_type":random.choice(resources),
-                "resource_amount":random.randint(5,20)
+                "resource_type":self.rng.choice(resources),
+                "resource_amount":self.rng.randint(5,20)
             }
             self.planets.append(planet)
-            self.occupied_positions.add(position)
+            self.add_to_index(planet)
+            self.occupy(position)
             self.grid[position] = PLANET
         
         # generating meteors
@@ -110,16 +369,17 @@ class SpaceEnvironment:
             position = self.get_ranom_empty_position()
             # random movements for 5 timesteps
             directions= ["UP", "DOWN", "LEFT", "RIGHT"]
-            pattern = [random.choice(directions) for j in range(5)]
+            pattern = [self.rng.choice(directions) for j in range(5)]
             meteor= {
                 "type":METEOR,
                 "position":position,
-                "damage":random.randint(5,15),
+                "damage":self.rng.randint(5,15),
                 "movement_pattern": pattern,
                 "pattern_i":0
             }
             self.meteors.append(meteor)
-            self.occupied_positions.add(position)
+            self.add_to_index(meteor)
+            self.occupy(position)
             self.grid[position] = METEOR
 
         # generating nebulas
@@ -131,7 +391,8 @@ class SpaceEnvironment:
                 "sensor_reduction":1
             }
             self.nebulas.append(nebula)
-            self.occupied_positions.add(position)
+            self.add_to_index(nebula)
+            self.occupy(position)
             self.grid[position] = NEBULA
         
         # generating radiation zone
@@ -143,7 +404,8 @@ class SpaceEnvironment:
                 "damage":2
             }
             self.radiation_zones.append(radiation_zone)
-            self.occupied_positions.add(position)
+            self.add_to_index(radiation_zone)
+            self.occupy(position)
             self.grid[position] = RADIATION_ZONE
         
         # generating space stations
@@ -155,17 +417,77 @@ class SpaceEnvironment:
                 "refuel_amount":70
             }
             self.space_stations.append(space_station)
-            self.occupied_positions.add(position)
+            self.add_to_index(space_station)
+            self.occupy(position)
             self.grid[position] = SPACE_STATION
         
         return
     
+    # agent_state at the start of an episode
+    def initial_agent_state(self, fuel=100, health=100):
+        return {
+            "position": self.starting_position,
+            "fuel": fuel,
+            "health": health,
+            "collected_resources": {"water": 0, "minerals": 0, "oxygen": 0},
+            "explored_cells": ExploredCells(self.grid.shape, [self.starting_position]),
+            "covered_map_percentage": 0.0
+        }
+
+    # random position that is not occupied, raises ValueError if the grid is full
     def get_ranom_empty_position(self):
-        while True:
-            r = random.randint(0, self.grid_size[0]-1)
-            c = random.randint(0, self.grid_size[1]-1)
-            if (r,c) not in self.occupied_positions:
-                return (r,c)
+        return self.free_cells.sample(self.rng)
+
+    # occupied_positions and free_cells always change together
+    def occupy(self, position):
+        if self.occupied_shared:
+            self.occupied_positions = set(self.occupied_positions)
+            self.occupied_shared = False
+        self.occupied_positions.add(position)
+        self.free_cells.remove(position)
+
+    def vacate(self, position):
+        if self.occupied_shared:
+            self.occupied_positions = set(self.occupied_positions)
+            self.occupied_shared = False
+        self.occupied_positions.discard(position)
+        self.free_cells.add(position)
+
+    # grid changes after initialize_env, the grid is copied first while a snapshot shares it
+    def set_grid(self, position, entity_type):
+        if self.grid_shared:
+            self.grid = self.grid.copy()
+            self.grid_shared = False
+        self.grid[position] = entity_type
+
+    # ENTITY INDEX FUNCTIONS
+
+    def add_to_index(self, entity):
+        self.entity_index[entity["type"]].setdefault(entity["position"], []).append(entity)
+        if entity["type"] in HAZARD_TYPES:
+            self.hazards.add(entity["position"])
+
+    def remove_from_index(self, entity):
+        entities = self.entity_index[entity["type"]][entity["position"]]
+        entities.remove(entity)
+        if not entities:
+            del self.entity_index[entity["type"]][entity["position"]]
+            if entity["type"] in HAZARD_TYPES and not any(entity["position"] in self.entity_index[hazard_type]
+                                                         for hazard_type in HAZARD_TYPES):
+                self.hazards.discard(entity["position"])
+
+    # list of entities of entity_type on position
+    def entities_at(self, position, entity_type):
+        return self.entity_index[entity_type].get(position, [])
+
+    # planet on position or None
+    def planet_at(self, position):
+        planets = self.entity_index[PLANET].get(position)
+        return planets[0] if planets else None
+
+    # read-only Observation of this environment and agent_state for the agent
+    def observation(self, agent_state):
+        return Observation(self, agent_state)
 
     # ACTION FUNCTIONS
 
@@ -190,16 +512,29 @@ class SpaceEnvironment:
                 allowed_actions.append(direction)
 
         # check if collect is allowed
-        for planet in self.planets:    
-            if agent_position == planet["position"]:
-                allowed_actions.append("COLLECT")
+        if agent_position in self.entity_index[PLANET]:
+            allowed_actions.append("COLLECT")
 
         # check if dock id allowed
-        for station in self.space_stations:    
-            if agent_position == station["position"]:
-                allowed_actions.append("DOCK")
+        if agent_position in self.entity_index[SPACE_STATION]:
+            allowed_actions.append("DOCK")
 
         return allowed_actions
+
+    # same as action in self.actions(agent_state) without building the list
+    def is_action_allowed(self, agent_state, action):
+        if action == "SCAN": return True
+        if agent_state["health"] <= 0: return False
+        if agent_state["fuel"] <= 0: return False
+
+        agent_position = agent_state["position"]
+        if action in ["UP", "DOWN", "LEFT", "RIGHT"]:
+            return self.is_valid_position(self.get_new_position(agent_position, action))
+        if action == "COLLECT":
+            return agent_position in self.entity_index[PLANET]
+        if action == "DOCK":
+            return agent_position in self.entity_index[SPACE_STATION]
+        return False
     
     def get_new_position(self, position, direction):
         row, col = position
@@ -228,7 +563,7 @@ class SpaceEnvironment:
         percepts = []
 
         # check if action is allowed
-        if action not in self.actions(agent_state): 
+        if not self.is_action_allowed(agent_state, action): 
             return {"agent_state":agent_state, "percepts":percepts}
         
         agent_health = agent_state["health"]
@@ -238,14 +573,13 @@ class SpaceEnvironment:
         # if action is move
         if action in ["UP", "DOWN", "LEFT", "RIGHT"]:
             # empty current position
-            if agent_position in self.occupied_positions:
-                self.occupied_positions.remove(agent_position)
-            self.grid[agent_position] = EMPTY
+            self.vacate(agent_position)
+            self.set_grid(agent_position, EMPTY)
             # move to new position
             agent_position = self.get_new_position(agent_position, action)
             # update grid with new agent position
-            self.grid[agent_position] = AGENT
-            self.occupied_positions.add(agent_position)
+            self.set_grid(agent_position, AGENT)
+            self.occupy(agent_position)
 
             agent_state["explored_cells"].add(agent_position)
             total_cells = self.grid.shape[0] * self.grid.shape[1]
@@ -257,21 +591,18 @@ class SpaceEnvironment:
             # check for effects of new position
 
             # meteors 
-            for meteor in self.meteors:
-                if meteor["position"] == agent_position:
-                    agent_health -= meteor["damage"]
+            for meteor in self.entities_at(agent_position, METEOR):
+                agent_health -= meteor["damage"]
             # radiation zones
-            for radiation_zone in self.radiation_zones:
-                if radiation_zone["position"] == agent_position:
-                    agent_health -= radiation_zone["damage"]
+            for radiation_zone in self.entities_at(agent_position, RADIATION_ZONE):
+                agent_health -= radiation_zone["damage"]
 
         elif action == "SCAN":
             sensor_range = 3            
 
             # check if in nebula
-            for nebula in self.nebulas:
-                if agent_position == nebula["position"]:
-                    sensor_range -= nebula["sensor_reduction"]
+            for nebula in self.entities_at(agent_position, NEBULA):
+                sensor_range -= nebula["sensor_reduction"]
             
             # check if scan is in bounds
             row, col = agent_position
@@ -279,29 +610,35 @@ class SpaceEnvironment:
             max_row = min(self.grid.shape[0] - 1, row + sensor_range)
             min_col = max(0, col - sensor_range)
             max_col = min(self.grid.shape[1] - 1, col + sensor_range)
-            # 
-            for r in range(min_row, max_row + 1):
-                for c in range(min_col, max_col + 1):
-                    pos = (r, c)
-                    entity_type = self.grid[pos]
-
-                    # add scanned cells
-                    percept = {"position": pos, "entity_type": entity_type}
-                    percepts.append(percept)
-                    
-                    # mark cell as explored
-                    agent_state["explored_cells"].add(pos)
+            if self.percept_mode == "array":
+                # view of the scanned window, no per cell dicts
+                window = self.grid[min_row:max_row + 1, min_col:max_col + 1].view()
+                window.flags.writeable = False
+                percepts = ScanWindow(window, (min_row, min_col))
+            else:
+                for r in range(min_row, max_row + 1):
+                    for c in range(min_col, max_col + 1):
+                        pos = (r, c)
+                        entity_type = self.grid[pos]
+
+                        # add scanned cells
+                        percept = {"position": pos, "entity_type": entity_type}
+                        percepts.append(percept)
+
+            # mark cells as explored
+            explored_cells = agent_state["explored_cells"]
+            if isinstance(explored_cells, ExploredCells):
+                if min_row <= max_row and min_col <= max_col:
+                    explored_cells.mark_window(min_row, max_row, min_col, max_col)
+            else:
+                explored_cells.update(itertools.product(range(min_row, max_row + 1), range(min_col, max_col + 1)))
             # update covered map percentage
             total_cells = self.grid.shape[0] * self.grid.shape[1]
             agent_state["covered_map_percentage"] = (len(agent_state["explored_cells"]) / total_cells) * 100
 
         elif action == "COLLECT":
-            planet=None
             # find which planet agent is on
-            for p in self.planets:
-                if p["position"] == agent_position:
-                    planet = p
-                    break
+            planet = self.planet_at(agent_position)
             
             if planet is not None:
                 # collect resource
@@ -312,9 +649,9 @@ class SpaceEnvironment:
             
             station = None
             # find which station agent is on
-            for s in self.space_stations:
-                if s["position"] == agent_position:
-                    station = s
+            stations = self.entities_at(agent_position, SPACE_STATION)
+            if stations:
+                station = stations[-1]
             if station is not None:
                 # refuel
                 agent_fuel += station["refuel_amount"]
@@ -340,34 +677,136 @@ class SpaceEnvironment:
         directions= ["UP", "DOWN", "LEFT", "RIGHT"]
         for meteor in self.meteors:
             # random direction
-            direction = random.choice(directions)
+            direction = self.rng.choice(directions)
             new_pos = self.get_new_position(meteor["position"], direction)
             
             if self.is_valid_position(new_pos) and (new_pos not in self.occupied_positions or new_pos == agent_position):
                 # make old position emtpy
-                if meteor["position"] in self.occupied_positions:
-                    self.occupied_positions.remove(meteor["position"])
-                self.grid[meteor["position"]] = EMPTY
+                self.vacate(meteor["position"])
+                self.set_grid(meteor["position"], EMPTY)
                 # update position
+                self.remove_from_index(meteor)
                 meteor["position"] = new_pos
-                self.occupied_positions.add(new_pos)
+                self.add_to_index(meteor)
+                self.occupy(new_pos)
 
                 # check collision
                 if new_pos == agent_position:
                     agent_state["health"] -= meteor["damage"]
     
     def add_nebula(self):
-        # 2% chance to generate a nebula
-        if random.random() < 0.02:
+        # 2% chance to generate a nebula, a full grid has no room for it
+        if self.rng.random() < 0.02 and len(self.free_cells):
             position = self.get_ranom_empty_position()
             nebula = {
                 "type":NEBULA,
                 "position":position,
                 "sensor_reduction":1
             }
-            self.grid[position] = NEBULA
+            self.set_grid(position, NEBULA)
             self.nebulas.append(nebula)
-            self.occupied_positions.add(position)
+            self.add_to_index(nebula)
+            self.occupy(position)
+
+    # SNAPSHOT FUNCTIONS
+
+    # state of the environment, and of agent_state when given, for restore()
+    # the grid, occupied_positions, the free cell pool and the explored cells are not copied but shared
+    # until one side changes them, entities are kept as the fields that change during an episode
+    # (meteor positions, planet resource amounts, the list of nebulas), so a snapshot costs microseconds
+    def snapshot(self, agent_state=None):
+        self.grid_shared = True
+        self.occupied_shared = True
+        snapshot = EnvSnapshot()
+        snapshot.planets = self.planets
+        snapshot.meteors = self.meteors
+        snapshot.grid = self.grid
+        snapshot.occupied_positions = self.occupied_positions
+        snapshot.free_cells = self.free_cells.snapshot()
+        snapshot.meteor_positions = [meteor["position"] for meteor in self.meteors]
+        snapshot.resource_amounts = [planet["resource_amount"] for planet in self.planets]
+        snapshot.nebulas = list(self.nebulas)
+        snapshot.timestep = self.timestep
+        snapshot.rng_state = self.rng.getstate()
+        snapshot.agent_state = None
+        if agent_state is not None:
+            explored_cells = agent_state["explored_cells"]
+            snapshot.agent_state = (
+                agent_state["position"], agent_state["fuel"], agent_state["health"],
+                dict(agent_state["collected_resources"]), agent_state["covered_map_percentage"],
+                explored_cells.snapshot() if isinstance(explored_cells, ExploredCells) else set(explored_cells),
+            )
+        return snapshot
+
+    # copies what the environment, and agent_state when given, share with a snapshot, the next changes then copy nothing
+    def own(self, agent_state=None):
+        if self.grid_shared:
+            self.grid = self.grid.copy()
+            self.grid_shared = False
+        if self.occupied_shared:
+            self.occupied_positions = set(self.occupied_positions)
+            self.occupied_shared = False
+        self.free_cells.own()
+        if agent_state is not None and isinstance(agent_state["explored_cells"], ExploredCells):
+            agent_state["explored_cells"].own()
+
+    # puts the environment back to snapshot, and agent_state when given (changed in place, so observations stay valid)
+    # the entity index and hazards are only fixed for the entities that differ from the snapshot
+    def restore(self, snapshot, agent_state=None):
+        if snapshot.planets is not self.planets or snapshot.meteors is not self.meteors:
+            raise ValueError("snapshot is from before the last initialize_env")
+        self.grid = snapshot.grid
+        self.grid_shared = True
+        self.occupied_positions = snapshot.occupied_positions
+        self.occupied_shared = True
+        self.free_cells.restore(snapshot.free_cells)
+
+        moved = [(meteor, position) for meteor, position in zip(self.meteors, snapshot.meteor_positions)
+                 if meteor["position"] != position]
+        if len(moved) * 4 > len(self.meteors):
+            # most meteors move on every step, one pass over all of them is cheaper than moving each one in the index
+            meteor_index = {}
+            for meteor, position in zip(self.meteors, snapshot.meteor_positions):
+                meteor["position"] = position
+                meteor_index.setdefault(position, []).append(meteor)
+            self.entity_index[METEOR] = meteor_index
+            self.hazards.clear()
+            self.hazards.update(meteor_index)
+            self.hazards.update(self.entity_index[RADIATION_ZONE])
+        else:
+            for meteor, position in moved:
+                self.remove_from_index(meteor)
+                meteor["position"] = position
+                self.add_to_index(meteor)
+        for planet, amount in zip(self.planets, snapshot.resource_amounts):
+            planet["resource_amount"] = amount
+        # nebulas are only ever added, the lists differ after their common start
+        common = 0
+        for old, new in zip(self.nebulas, snapshot.nebulas):
+            if old is not new:
+                break
+            common += 1
+        for nebula in self.nebulas[common:]:
+            self.remove_from_index(nebula)
+        for nebula in snapshot.nebulas[common:]:
+            self.add_to_index(nebula)
+        self.nebulas[:] = snapshot.nebulas
+
+        self.timestep = snapshot.timestep
+        self.rng.setstate(snapshot.rng_state)
+
+        if agent_state is not None and snapshot.agent_state is not None:
+            position, fuel, health, resources, coverage, explored = snapshot.agent_state
+            agent_state["position"] = position
+            agent_state["fuel"] = fuel
+            agent_state["health"] = health
+            agent_state["collected_resources"].update(resources)
+            agent_state["covered_map_percentage"] = coverage
+            if isinstance(explored, tuple):
+                agent_state["explored_cells"].restore(explored)
+            else:
+                agent_state["explored_cells"].clear()
+                agent_state["explored_cells"].update(explored)
 
     # GOAL FUNCTION
     # returns dic {is_game_over:true, is_map_covered:true, is_resources_met:false}
@@ -1,100 +1,287 @@
 import heapq
+import itertools
 import random
 import math
+import time
 from collections import deque
 
+import numpy as np
+
+from AgentMemory import AgentMemory, FrontierSet, UNKNOWN
+from Pathfinding import PathCache, DStarLite, StationDistanceField, GridAStar, HierarchicalPlanner, DeadlineExceeded, check_deadline
+
+# part of a choose_action budget kept for fall_back, which takes at most about 0.06 ms
+FALLBACK_MS = 0.15
+
+# state saved by Agent.snapshot(), only read by restore()
+class AgentSnapshot:
+    pass
+
 class Agent:
-    def __init__(self, initial_agent_info, N, monster_coords=None, sensor_range=3, fuel=100, health=100, location=(0,0)):
+    # planner picks how paths to targets are found
+    # "astar" runs find_safe_path from scratch, "dstar" keeps a D* Lite search between steps and repairs it,
+    # "hierarchical" plans over cluster entrances and only walks the first leg of the route before planning again
+    # avoid_stranding drops targets from which no station could be reached with the fuel left
+    def __init__(self, initial_agent_info, N, monster_coords=None, sensor_range=3, fuel=100, health=100, location=(0,0), seed=None, planner="astar",
+                 avoid_stranding=False):
+        if planner not in ["astar", "dstar", "hierarchical"]:
+            raise ValueError(f"unknown planner {planner!r}")
+        self.planner = planner
+        self.rng = random.Random(seed)
         self.available_actions = ['UP', 'DOWN', 'RIGHT', 'LEFT', 'SCAN', 'COLLECT', 'DOCK']
         self.health = health
         self.sensor_range = sensor_range
         self.fuel = fuel
         self.location = location
-        self.N = N
+        # N is the grid size, an int for an N x N grid or a (rows, cols) tuple
+        self.rows, self.cols = (N, N) if isinstance(N, int) else N
         self.monster_coords = monster_coords if monster_coords else set()
-        self.memory = {}
+        self.memory = AgentMemory((self.rows, self.cols))
+        # frontier of memory, updated by sense
+        self.frontier = FrontierSet((self.rows, self.cols))
         self.resources = {"water": 0, "minerals": 0, "oxygen": 0}
         self.mapped_percentage = 0.0
         self.resource_goals = initial_agent_info.get('resource_goals', {"water":10, "minerals":15, "oxygen":5})
         self.planets_in_memory = []
+        # position -> planet in planets_in_memory
+        self.planet_memory_index = {}
         self.visited_locations = set([location])
         self.last_positions = deque([location], maxlen=10)
         self.current_target = None
+        # search engine of find_safe_path
+        self.astar = GridAStar((self.rows, self.cols))
+        # cells expanded by all find_path_costs and find_nearest_frontier searches so far
+        self.path_costs_expanded = 0
+        self.frontier_search_expanded = 0
+        # path to current_target, reused until the map or fuel no longer allow it
+        self.path_cache = PathCache()
+        # D* Lite search to the current goal, with the cost changes it has not seen yet
+        self.dstar = None
+        self.dstar_monsters = set()
+        self.cost_changes = []
+        # cluster abstraction of the hierarchical planner, with the cells sensed since its last update
+        self.hierarchy = HierarchicalPlanner((self.rows, self.cols), self.move_cost) if planner == "hierarchical" else None
+        self.hierarchy_monsters = set()
+        self.hierarchy_changes = set()
+        # distance to the nearest station from every cell, brought up to date by update_station_field
+        # fuel is the tank size, no path longer than that is ever needed
+        self.station_field = StationDistanceField((self.rows, self.cols), self.move_cost, max_cost=fuel)
+        self.station_field_monsters = set()
+        self.station_field_changes = set()
+        self.avoid_stranding = avoid_stranding
         self.fuel_reserve = 20
         self.last_scan_position = None
         self.resource_priority_multiplier = 4.0
         self.exploration_priority_multiplier = 3.0
         self.target_history = []
         self.last_decision_reason = ""
+        # deadline of the current choose_action call (a time.perf_counter() value), None without a budget
+        self.deadline = None
+        # target with a path found during the current choose_action call
+        self.best_candidate = None
+        # what choose_action answered with when it ran out of time, None when planning finished in time
+        self.last_fallback = None
+        self.fallback_count = 0
+        # visited_locations and target_history are shared with a snapshot, the next change copies them first
+        self.history_shared = False
+
+    # a copied or pickled agent keeps a plain copy of the resources it last observed, the next observe() links it
+    # to an environment again
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["resources"] = dict(self.resources)
+        return state
 
     def in_loop(self):
         if len(self.last_positions) < self.last_positions.maxlen:
             return False
         return len(set(self.last_positions)) < len(self.last_positions)/2
 
-    def get_next_move(self, environment):
+    def get_next_move(self, observation):
         if self.fuel < 15:
             self.last_decision_reason = "Emergency fuel - critically low"
-            station = self.find_nearest_reachable_station(environment)
+            station = self.find_nearest_reachable_station(observation)
             if station:
-                path = self.find_safe_path(self.location, station, environment)
-                if path:
-                    next_pos = path[0]
-                    return self.get_move_action(self.location, next_pos)
+                next_pos = self.station_field.next_cell[self.location]
+                return self.get_move_action(self.location, next_pos)
         
         if not self.current_target or self.in_loop():
-            self.select_new_target(environment)
+            self.select_new_target(observation)
         
         if self.current_target:
-            path = self.find_safe_path(self.location, self.current_target, environment)
+            path = self.plan_path(self.current_target, observation)
             if path and len(path) <= (self.fuel - 10):
                 next_pos = path[0]
                 return self.get_move_action(self.location, next_pos)
             else:
                 self.last_decision_reason = "Target too far, reassessing"
-                self.select_new_target(environment)
+                self.select_new_target(observation)
                 if self.current_target:
-                    path = self.find_safe_path(self.location, self.current_target, environment)
+                    path = self.plan_path(self.current_target, observation)
                     if path:
                         next_pos = path[0]
                         return self.get_move_action(self.location, next_pos)
         
         self.last_decision_reason = "Active exploration"
-        return self.explore_actively(environment)
+        return self.explore_actively(observation)
 
-    def find_safe_path(self, start, goal, environment):
-        def heuristic(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
+    # A* with the cost model of move_cost, the path has to fit in the fuel left
+    def find_safe_path(self, start, goal, observation):
+        return self.astar.search(start, goal, self.memory.flat, self.monster_coords, self.fuel, self.deadline)
+
+    # path from the agent's location to goal, the cached one when it is still valid
+    def plan_path(self, goal, observation):
+        path = self.path_cache.get(self.location, goal, self.fuel, self.monster_coords)
+        if path is None:
+            if self.planner == "dstar":
+                path = self.find_incremental_path(goal)
+            elif self.planner == "hierarchical":
+                path = self.find_hierarchical_path(goal)
+            else:
+                path = self.find_safe_path(self.location, goal, observation)
+            self.remember_path(goal, path)
+        return path
+
+    # same path cost as find_safe_path, but the D* Lite search is kept while the goal stays the same
+    # and only repaired around the cells whose move cost changed since the last call
+    def find_incremental_path(self, goal):
+        if self.dstar is None or self.dstar.goal != goal:
+            self.dstar = DStarLite((self.rows, self.cols), self.move_cost, self.location, goal)
+            self.dstar_monsters = set(self.monster_coords)
+            self.cost_changes = []
+        else:
+            self.dstar.move_start(self.location)
+            # sensed cells and known cells that a meteor moved on or off, the cells not looked at before the deadline
+            # stay in cost_changes for the next call
+            self.cost_changes.extend(self.monster_coords.symmetric_difference(self.dstar_monsters))
+            self.dstar_monsters = set(self.monster_coords)
+            view = self.memory.view
+            changed = set()
+            try:
+                while self.cost_changes:
+                    if len(self.cost_changes) % 8 == 0:
+                        check_deadline(self.deadline)
+                    pos = self.cost_changes.pop()
+                    if view[pos] != UNKNOWN:
+                        changed.add(pos)
+            finally:
+                self.dstar.update_cells(changed)
+        return self.dstar.path(self.fuel, self.deadline)
 
-        frontier = []
-        heapq.heappush(frontier, (0, start))
+    # first leg of the route to goal over the cluster entrances, the whole route has to fit in the fuel left
+    def find_hierarchical_path(self, goal):
+        self.hierarchy_changes.update(self.monster_coords.symmetric_difference(self.hierarchy_monsters))
+        self.hierarchy_monsters = set(self.monster_coords)
+        self.hierarchy.update_cells(self.hierarchy_changes, self.deadline)
+        return self.hierarchy.first_leg(self.location, goal, self.fuel, self.deadline)
+
+    def remember_path(self, goal, path):
+        self.path_cache.store(self.location, goal, path, [self.move_cost(pos) for pos in path], self.monster_coords)
+
+    # cost of moving into pos, the cost model of find_safe_path
+    def move_cost(self, pos):
+        return self.cell_cost(self.memory.view[pos], pos)
+
+    # cost of moving into pos if its memory cell was cell_type
+    def cell_cost(self, cell_type, pos):
+        if cell_type == UNKNOWN:
+            return 1
+        if cell_type == 5:
+            return 2
+        if cell_type in [3, 6] or pos in self.monster_coords:
+            return 20
+        return 1
+
+    # Dijkstra from start with the cost model and fuel limit of find_safe_path
+    # stops once every target is reached, returns (cost_so_far, came_from) for every reached cell
+    # raises DeadlineExceeded once the deadline has passed
+    def find_path_costs(self, start, targets):
+        remaining = set(targets)
+        remaining.discard(start)
+        frontier = [(0, start)]
         came_from = {start: None}
         cost_so_far = {start: 0}
-        
-        while frontier:
-            _, current = heapq.heappop(frontier)
+        steps = 0
+        
+        try:
+            while frontier and remaining:
+                steps += 1
+                if steps % 8 == 0:
+                    check_deadline(self.deadline)
+                cost, current = heapq.heappop(frontier)
+                if cost > cost_so_far[current]:
+                    continue
+                remaining.discard(current)
+                
+                row, col = current
+                for next_pos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+                    if not (0 <= next_pos[0] < self.rows and 0 <= next_pos[1] < self.cols):
+                        continue
+                    new_cost = cost + self.move_cost(next_pos)
+                    if (next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]) and new_cost <= self.fuel:
+                        cost_so_far[next_pos] = new_cost
+                        came_from[next_pos] = current
+                        heapq.heappush(frontier, (new_cost, next_pos))
+        finally:
+            self.path_costs_expanded += steps
+        
+        return cost_so_far, came_from
+
+    # Dijkstra from the agent with the cost model of find_safe_path, bounded by fuel - 5
+    # frontier cells (unknown cells next to known ones) are not expanded, the search stops after the cheapest ones,
+    # of those the one ranked first by find_exploration_targets wins
+    # returns (target, path) or None when no frontier cell can be reached
+    def find_nearest_frontier(self):
+        if not len(self.frontier):
+            return None
+        start = self.location
+        max_cost = self.fuel - 5
+        view = self.memory.view
+        queue = [(0, start)]
+        came_from = {start: None}
+        cost_so_far = {start: 0}
+        best = None
+        steps = 0
+        
+        try:
+            while queue:
+                cost, current = heapq.heappop(queue)
+                if best and cost > best[0]:
+                    break
+                if cost > cost_so_far[current]:
+                    continue
+                steps += 1
+                if steps % 8 == 0:
+                    check_deadline(self.deadline)
             
-            if current == goal:
-                break
+                if current != start and view[current] == UNKNOWN:
+                    score = self.frontier.view[current]
+                    if self.last_scan_position and self.heuristic(current, self.last_scan_position) <= 3:
+                        score -= 2
+                    if best is None or (cost, -score, current) < best:
+                        best = (cost, -score, current)
+                    continue
             
-            for next_pos in self.get_safe_neighbors(current, environment):
-                move_cost = 1
-                
-                if next_pos in self.memory:
-                    cell_type = self.memory[next_pos]
-                    if cell_type == 5:
-                        move_cost = 2
-                    elif cell_type in [3, 6] or next_pos in self.monster_coords:
-                        move_cost = 20
-                
-                new_cost = cost_so_far[current] + move_cost
-                
-                if (next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]) and new_cost <= self.fuel:
-                    cost_so_far[next_pos] = new_cost
-                    priority = new_cost + heuristic(next_pos, goal)
-                    heapq.heappush(frontier, (priority, next_pos))
-                    came_from[next_pos] = current
-        
+                row, col = current
+                for next_pos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+                    if not (0 <= next_pos[0] < self.rows and 0 <= next_pos[1] < self.cols):
+                        continue
+                    new_cost = cost + self.move_cost(next_pos)
+                    if (next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]) and new_cost <= max_cost:
+                        cost_so_far[next_pos] = new_cost
+                        came_from[next_pos] = current
+                        heapq.heappush(queue, (new_cost, next_pos))
+        finally:
+            self.frontier_search_expanded += steps
+        
+        if best is None:
+            return None
+        target = best[2]
+        return target, self.extract_path(start, target, (cost_so_far, came_from))
+
+    # path from start to goal (start excluded) out of a (cost_so_far, came_from) search result
+    def extract_path(self, start, goal, search):
+        came_from = search[1]
         if goal not in came_from:
             return []
             
@@ -109,175 +296,157 @@ class Agent:
         path.reverse()
         return path
 
-    def get_safe_neighbors(self, position, environment):
-        row, col = position
-        neighbors = []
-        
-        for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
-            r, c = row + dr, col + dc
-            if 0 <= r < self.N and 0 <= c < self.N:
-                weight = 0
-                pos = (r, c)
-                
-                if pos in self.last_positions:
-                    weight += 5
-                
-                if pos not in self.memory:
-                    weight -= 4
-                
-                if pos in self.memory and self.memory[pos] in [3, 6]:
-                    weight += 50
-                if pos in self.monster_coords:
-                    weight += 50
-                
-                neighbors.append((weight, pos))
-        
-        neighbors.sort(key=lambda x: x[0])
-        return [pos for _, pos in neighbors]
+    # nearest station by path cost whose path fits in the fuel left, None when the agent is on it
+    def find_nearest_reachable_station(self, observation):
+        self.update_station_field(observation)
+        if self.location in self.station_field.next_cell and self.station_field[self.location] <= self.fuel:
+            return self.station_field.station[self.location]
+        return None
 
-    def find_nearest_reachable_station(self, environment):
-        nearest = None
-        min_dist = float('inf')
-        
-        for station in environment.space_stations:
-            dist = self.heuristic(self.location, station['position'])
-            if dist < min_dist:
-                path = self.find_safe_path(self.location, station['position'], environment)
-                if path and len(path) <= self.fuel:
-                    nearest = station['position']
-                    min_dist = dist
-        
-        return nearest
+    # brings station_field up to date with the stations and the cells sensed and meteors moved since the last call
+    def update_station_field(self, observation):
+        self.station_field_changes.update(self.monster_coords.symmetric_difference(self.station_field_monsters))
+        self.station_field_monsters = set(self.monster_coords)
+        self.station_field.update_cells(self.station_field_changes, self.deadline)
+        self.station_field.add_stations(observation.station_positions)
+        self.station_field.propagate(self.deadline)
 
-    def select_new_target(self, environment):
+    # a station can still be reached after moving to target for cost fuel
+    def can_refuel_after(self, target, cost):
+        return cost + self.station_field[target] <= self.fuel
+
+    def select_new_target(self, observation):
         options = []
         needed_resources = self.calculate_needed_resources()
         old_target = self.current_target
         
+        # candidate targets
+        planets = []
         if any(needed_resources.values()):
             for planet in self.planets_in_memory:
-                if planet.get('resource_amount', 0) > 0:
-                    resource_type = planet.get('resource_type')
-                    if needed_resources.get(resource_type, 0) > 0:
-                        dist = self.heuristic(self.location, planet['position'])
-                        
-                        resource_priority = needed_resources[resource_type] / max(1, self.resource_goals[resource_type])
-                        
-                        priority = (resource_priority * self.resource_priority_multiplier) / max(1, dist)
-                        
-                        fuel_needed = dist + 5
-                        if self.fuel >= fuel_needed:
-                            options.append((priority, planet['position'], f"Need {resource_type}"))
-        
-        if self.mapped_percentage < environment.mapping_goal_percentage:
-            exploration_targets = self.find_exploration_targets()
-            
-            for dist, target in exploration_targets[:5]:
-                exploration_priority = 1.0 - (self.mapped_percentage / environment.mapping_goal_percentage)
+                check_deadline(self.deadline)
+                if planet.get('resource_amount', 0) > 0 and needed_resources.get(planet.get('resource_type'), 0) > 0:
+                    planets.append(planet)
+        
+        exploration_targets = []
+        if self.mapped_percentage < observation.mapping_goal_percentage:
+            exploration_targets = [target for _, target in itertools.islice(self.find_exploration_targets(), 5)]
+        
+        if self.avoid_stranding:
+            self.update_station_field(observation)
+        
+        resources_met = all(v <= 0 for v in needed_resources.values())
+        map_covered = self.mapped_percentage >= observation.mapping_goal_percentage
+        end_targets = []
+        if resources_met and map_covered and observation.end_position:
+            end_targets = [observation.end_position]
+        
+        # one search gives the real path cost of every candidate, unreachable ones are dropped
+        search = self.find_path_costs(self.location, [planet['position'] for planet in planets] + exploration_targets + end_targets)
+        cost_so_far = search[0]
+        
+        for planet in planets:
+            check_deadline(self.deadline)
+            if planet['position'] in cost_so_far:
+                resource_type = planet.get('resource_type')
+                dist = cost_so_far[planet['position']]
+                
+                resource_priority = needed_resources[resource_type] / max(1, self.resource_goals[resource_type])
+                
+                priority = (resource_priority * self.resource_priority_multiplier) / max(1, dist)
+                
+                fuel_needed = dist + 5
+                if self.fuel >= fuel_needed and (not self.avoid_stranding or self.can_refuel_after(planet['position'], dist)):
+                    options.append((priority, planet['position'], f"Need {resource_type}"))
+        
+        for target in exploration_targets:
+            check_deadline(self.deadline)
+            if target in cost_so_far:
+                dist = cost_so_far[target]
+                exploration_priority = 1.0 - (self.mapped_percentage / observation.mapping_goal_percentage)
                 priority = (exploration_priority * self.exploration_priority_multiplier) / max(1, dist)
                 
                 fuel_needed = dist + 5
-                if self.fuel >= fuel_needed:
+                if self.fuel >= fuel_needed and (not self.avoid_stranding or self.can_refuel_after(target, dist)):
                     options.append((priority, target, "Exploration"))
         
+        # the station comes with its own path out of station_field
+        paths = {}
         if self.fuel < 30:
-            station = self.find_nearest_reachable_station(environment)
+            station = self.find_nearest_reachable_station(observation)
             if station:
-                dist = self.heuristic(self.location, station)
+                dist = self.station_field[self.location]
                 priority = (30 - self.fuel)/max(1, dist * 2)
                 options.append((priority, station, "Getting low on fuel"))
+                paths[station] = self.station_field.path(self.location)
         
-        resources_met = all(v <= 0 for v in needed_resources.values())
-        map_covered = self.mapped_percentage >= environment.mapping_goal_percentage
-        
-        if resources_met and map_covered and environment.end_position:
-            dist = self.heuristic(self.location, environment.end_position)
-            if self.fuel >= dist:
-                options.append((10.0, environment.end_position, "Mission complete, going to end"))
+        for end_position in end_targets:
+            if end_position in cost_so_far:
+                dist = cost_so_far[end_position]
+                if self.fuel >= dist:
+                    options.append((10.0, end_position, "Mission complete, going to end"))
         
         if options:
             options.sort(reverse=True)
             
             for priority, target, reason in options:
-                path = self.find_safe_path(self.location, target, environment)
+                check_deadline(self.deadline)
+                path = paths[target] if target in paths else self.extract_path(self.location, target, search)
                 if path and len(path) <= (self.fuel - 5):
+                    self.best_candidate = (target, path)
+                    self.remember_path(target, path)
                     self.current_target = target
                     self.last_decision_reason = reason
+                    self.own_history()
                     self.target_history.append((target, reason))
                     
                     if old_target != target:
                         self.last_positions = deque([self.location], maxlen=10)
                     return
         
-        fallback_target = self.find_exploration_spot(environment)
+        fallback_target = self.find_exploration_spot(observation)
         if fallback_target:
             self.current_target = fallback_target
             self.last_decision_reason = "Exploration fallback"
+            self.own_history()
             self.target_history.append((fallback_target, "Fallback exploration"))
 
+    # frontier cells as (dist, pos), best first, as a lazy iterator: cells are only ranked as they are consumed
     def find_exploration_targets(self):
-        frontier = []
-        
-        for (r, c) in self.memory:
-            for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
-                nr, nc = r + dr, c + dc
-                pos = (nr, nc)
-                
-                if (0 <= nr < self.N and 0 <= nc < self.N and pos not in self.memory):
-                    unexplored_neighbors = 0
-                    for dr2, dc2 in [(-1,0), (1,0), (0,-1), (0,1)]:
-                        r2, c2 = nr + dr2, nc + dc2
-                        if (0 <= r2 < self.N and 0 <= c2 < self.N and (r2, c2) not in self.memory):
-                            unexplored_neighbors += 1
-                    
-                    dist = self.heuristic(self.location, pos)
-                    
-                    score = unexplored_neighbors
-                    
-                    if self.last_scan_position and self.heuristic(pos, self.last_scan_position) < 4:
-                        score -= 2
-                    
-                    frontier.append((dist, pos, score))
-        
-        frontier.sort(key=lambda x: (-x[2], x[0]))
-        
-        return [(dist, pos) for dist, pos, _ in frontier]
+        return self.frontier.ranked(self.location, self.last_scan_position, lambda: check_deadline(self.deadline))
 
-    def find_exploration_spot(self, environment):
-        targets = self.find_exploration_targets()
-        if targets:
-            for dist, target in targets:
-                if dist <= self.fuel - 5:
-                    path = self.find_safe_path(self.location, target, environment)
-                    if path:
-                        return target
-        
-        potential_spots = []
-        
-        for pos in self.memory:
-            if self.memory[pos] not in [3, 6] and pos not in self.monster_coords:
-                has_unexplored = False
-                for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
-                    nr, nc = pos[0] + dr, pos[1] + dc
-                    if (0 <= nr < self.N and 0 <= nc < self.N and (nr, nc) not in self.memory):
-                        has_unexplored = True
-                        break
-                
-                if has_unexplored:
-                    dist = self.heuristic(self.location, pos)
-                    if dist <= self.fuel - 5:
-                        potential_spots.append((dist, pos))
-        
-        potential_spots.sort()
-        return potential_spots[0][1] if potential_spots else None
+    def find_exploration_spot(self, observation):
+        nearest = self.find_nearest_frontier()
+        if nearest:
+            target, path = nearest
+            self.best_candidate = nearest
+            self.remember_path(target, path)
+            return target
+        
+        # known cells next to unexplored ones that are not dangerous
+        check_deadline(self.deadline)
+        rows, cols = self.memory.border()
+        safe = ~np.isin(self.memory.cells[rows, cols], [3, 6])
+        if self.monster_coords:
+            safe &= np.array([pos not in self.monster_coords for pos in zip(rows.tolist(), cols.tolist())], dtype=bool)
+        dist = np.abs(rows - self.location[0]) + np.abs(cols - self.location[1])
+        reachable = safe & (dist <= self.fuel - 5)
+        if not reachable.any():
+            return None
+        
+        # nearest spot, ties broken by position
+        rows, cols, dist = rows[reachable], cols[reachable], dist[reachable]
+        best = np.lexsort((cols, rows, dist))[0]
+        return (int(rows[best]), int(cols[best]))
 
-    def explore_actively(self, environment):
+    def explore_actively(self, observation):
         safe_moves = []
         
         for action in ['UP', 'DOWN', 'LEFT', 'RIGHT']:
+            check_deadline(self.deadline)
             new_pos = self.get_new_position(self.location, action)
             
-            if (0 <= new_pos[0] < self.N and 0 <= new_pos[1] < self.N):
+            if (0 <= new_pos[0] < self.rows and 0 <= new_pos[1] < self.cols):
                 is_safe = True
                 if new_pos in self.memory:
                     if self.memory[new_pos] in [3, 6]:
@@ -289,7 +458,7 @@ class Agent:
                     unexplored_value = 0
                     for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
                         nr, nc = new_pos[0] + dr, new_pos[1] + dc
-                        if (0 <= nr < self.N and 0 <= nc < self.N and (nr, nc) not in self.memory):
+                        if (0 <= nr < self.rows and 0 <= nc < self.cols and (nr, nc) not in self.memory):
                             unexplored_value += 2
                     
                     if new_pos not in self.memory:
@@ -318,15 +487,72 @@ class Agent:
             return (row, col + 1)
         return position
 
-    def choose_action(self, environment, allowed_actions):
+    # the agent's own state out of a SpaceEnvironment.Observation, nothing is copied:
+    # resources is a read-only proxy and monster_coords the environment's live set of hazard positions
+    def observe(self, observation):
+        self.location = observation.position
+        self.fuel = observation.fuel
+        self.health = observation.health
+        self.resources = observation.resources
+        self.monster_coords = observation.hazards
+
+    # observation is the SpaceEnvironment.Observation of the episode, the agent reads its state from it first
+    # budget_ms bounds the time of the call, when planning runs out of it the action comes from the cached
+    # path to the current target, then from the best target found so far, then from explore_actively
+    # planning stops FALLBACK_MS before the budget ends so the fallback still fits in it, last_fallback tells which
+    # one was used
+    # a garbage collection during the call counts against the budget, callers that need tight timings turn it off
+    def choose_action(self, observation, allowed_actions, budget_ms=None):
+        self.observe(observation)
+        self.deadline = None if budget_ms is None else time.perf_counter() + (budget_ms - FALLBACK_MS) / 1000
+        self.best_candidate = None
+        self.last_fallback = None
+        try:
+            return self.decide_action(observation, allowed_actions)
+        except DeadlineExceeded:
+            # the fallbacks take constant time
+            self.deadline = None
+            return self.fall_back(observation, allowed_actions)
+        finally:
+            self.deadline = None
+
+    # action of a choose_action call that ran out of time
+    def fall_back(self, observation, allowed_actions):
+        path = None
+        if self.current_target:
+            path = self.path_cache.get(self.location, self.current_target, self.fuel, self.monster_coords)
+        if path:
+            self.last_fallback = "cached path"
+            action = self.get_move_action(self.location, path[0])
+        elif self.best_candidate:
+            target, path = self.best_candidate
+            self.current_target = target
+            self.remember_path(target, path)
+            self.last_fallback = "best candidate"
+            action = self.get_move_action(self.location, path[0])
+        else:
+            self.last_fallback = "explore"
+            action = self.explore_actively(observation)
+        self.fallback_count += 1
+        self.last_decision_reason = f"Out of time, {self.last_fallback}"
+        
+        if action in allowed_actions:
+            return action
+        move_actions = [a for a in allowed_actions if a in ['UP', 'DOWN', 'LEFT', 'RIGHT']]
+        if move_actions:
+            return self.rng.choice(move_actions)
+        return allowed_actions[0]
+
+    def decide_action(self, observation, allowed_actions):
         self.last_positions.append(self.location)
+        self.own_history()
         self.visited_locations.add(self.location)
         
         if 'COLLECT' in allowed_actions:
-            for planet in environment.planets:
-                if planet['position'] == self.location and planet['resource_amount'] > 0:
-                    self.last_decision_reason = f"Collecting {planet['resource_type']}"
-                    return 'COLLECT'
+            planet = observation.planet_at(self.location)
+            if planet and planet['resource_amount'] > 0:
+                self.last_decision_reason = f"Collecting {planet['resource_type']}"
+                return 'COLLECT'
         
         should_scan = False
         
@@ -340,7 +566,7 @@ class Agent:
             unexplored_count = 0
             for dr, dc in [(-1,0), (1,0), (0,-1), (0,1)]:
                 nr, nc = self.location[0] + dr, self.location[1] + dc
-                if (0 <= nr < self.N and 0 <= nc < self.N and (nr, nc) not in self.memory):
+                if (0 <= nr < self.rows and 0 <= nc < self.cols and (nr, nc) not in self.memory):
                     unexplored_count += 1
             
             if unexplored_count > 0:
@@ -355,7 +581,7 @@ class Agent:
             self.last_decision_reason = "Refueling at station"
             return 'DOCK'
         
-        move_action = self.get_next_move(environment)
+        move_action = self.get_next_move(observation)
         if move_action in allowed_actions:
             return move_action
         
@@ -366,7 +592,7 @@ class Agent:
         
         move_actions = [a for a in allowed_actions if a in ['UP', 'DOWN', 'LEFT', 'RIGHT']]
         if move_actions:
-            return random.choice(move_actions)
+            return self.rng.choice(move_actions)
             
         self.last_decision_reason = "No viable actions"
         return allowed_actions[0]
@@ -399,38 +625,135 @@ class Agent:
         row, col = location
 
         if row == 0: possible_actions.remove('UP')
-        if row == self.N - 1: possible_actions.remove('DOWN')
+        if row == self.rows - 1: possible_actions.remove('DOWN')
         if col == 0: possible_actions.remove('LEFT')
-        if col == self.N - 1: possible_actions.remove('RIGHT')
+        if col == self.cols - 1: possible_actions.remove('RIGHT')
 
         return possible_actions
 
-    def sense(self, location, environment):
-        sensed_cells = set()
+    def sense(self, location, observation, percepts=None):
         row, col = location
         
-        current_range = self.sensor_range
-        if environment.grid[location] == 5:
-            current_range = max(1, current_range - 1)
-        
-        for r in range(max(0, row-current_range), min(self.N, row+current_range+1)):
-            for c in range(max(0, col-current_range), min(self.N, col+current_range+1)):
-                pos = (r, c)
-                sensed_cells.add(pos)
-                
-                self.memory[pos] = environment.grid[pos]
-                
-                if environment.grid[pos] == 2:
-                    planet_info = next((p for p in environment.planets if p['position'] == pos), None)
-                    if planet_info:
-                        existing_planet = next((p for p in self.planets_in_memory if p['position'] == pos), None)
-                        if existing_planet:
-                            existing_planet['resource_amount'] = planet_info['resource_amount']
-                            existing_planet['resource_type'] = planet_info['resource_type']
-                        else:
-                            self.planets_in_memory.append(planet_info.copy())
-                            
-        total_cells = self.N * self.N
-        self.mapped_percentage = (len(self.memory) / total_cells) * 100
-        
-        return sensed_cells
\ No newline at end of file
+        # percepts of an "array" mode SCAN are read directly instead of the observation grid
+        window = getattr(percepts, 'window', None)
+        if window is not None:
+            min_row, min_col = percepts.origin
+        else:
+            current_range = self.sensor_range
+            if observation.grid[location] == 5:
+                current_range = max(1, current_range - 1)
+            
+            min_row, min_col = max(0, row-current_range), max(0, col-current_range)
+            max_row, max_col = min(self.rows, row+current_range+1), min(self.cols, col+current_range+1)
+            window = observation.grid[min_row:max_row, min_col:max_col]
+        
+        rows, cols = window.shape
+        old_cells = self.memory.cells[min_row:min_row + rows, min_col:min_col + cols].copy()
+        self.memory.write_window(min_row, min_col, window)
+        self.astar.set_cells(min_row, min_col, window)
+        
+        # the D* Lite search, station_field and the hierarchy saw the meteors of their last update, not the current ones,
+        # so they are told about every rewritten cell and find out themselves which costs changed
+        rewritten = np.argwhere(old_cells != window).tolist()
+        self.station_field_changes.update((min_row + r, min_col + c) for r, c in rewritten)
+        if self.hierarchy is not None:
+            self.hierarchy_changes.update((min_row + r, min_col + c) for r, c in rewritten)
+        if self.dstar is not None:
+            self.cost_changes.extend((min_row + r, min_col + c) for r, c in rewritten)
+        
+        # cells whose move cost changed can make the cached path wrong
+        if self.path_cache.path:
+            changed = []
+            for r, c in rewritten:
+                pos = (min_row + r, min_col + c)
+                if self.cell_cost(old_cells[r, c], pos) != self.move_cost(pos):
+                    changed.append(pos)
+            self.path_cache.cells_changed(changed)
+        self.frontier.update(self.memory, min_row, min_row + rows - 1, min_col, min_col + cols - 1)
+        
+        for r, c in np.argwhere(window == 2).tolist():
+            self.remember_planet((min_row + r, min_col + c), observation)
+        
+        self.mapped_percentage = (len(self.memory) / (self.rows * self.cols)) * 100
+        
+        return set(itertools.product(range(min_row, min_row + rows), range(min_col, min_col + cols)))
+
+    # state of the agent for restore(), to branch together with SpaceEnvironment.snapshot() in a lookahead
+    # memory, the visited/target history, station_field and the D* Lite search are shared until one side changes them,
+    # the remembered planets, the small fields and the planned path are copied, so the agent continues exactly as it would have
+    # the hierarchy is not saved, its cluster costs only depend on the cells, restore() tells it which cells differ
+    # location, fuel, health, resources and monster_coords come from the observation on the next choose_action
+    def snapshot(self):
+        self.history_shared = True
+        snapshot = AgentSnapshot()
+        snapshot.memory = self.memory.snapshot()
+        snapshot.fields = (self.location, self.fuel, self.health, self.current_target, self.last_scan_position,
+                           self.mapped_percentage, self.last_decision_reason, self.fallback_count)
+        snapshot.last_positions = tuple(self.last_positions)
+        snapshot.visited_locations = self.visited_locations
+        snapshot.target_history = self.target_history
+        snapshot.planets = [planet.copy() for planet in self.planets_in_memory]
+        snapshot.path_cache = self.path_cache.snapshot()
+        snapshot.station_field = (self.station_field.snapshot(), self.station_field_monsters, set(self.station_field_changes))
+        snapshot.dstar = (self.dstar, self.dstar.snapshot() if self.dstar else None, self.dstar_monsters, list(self.cost_changes))
+        snapshot.rng_state = self.rng.getstate()
+        return snapshot
+
+    def restore(self, snapshot):
+        old_cells = self.memory.cells
+        self.memory.restore(snapshot.memory)
+        # the arrays are the same objects when memory was not written since, then nothing else changed either
+        if old_cells is not self.memory.cells:
+            self.memory_restored(old_cells)
+
+        (self.location, self.fuel, self.health, self.current_target, self.last_scan_position,
+         self.mapped_percentage, self.last_decision_reason, self.fallback_count) = snapshot.fields
+        self.last_positions = deque(snapshot.last_positions, maxlen=10)
+        self.visited_locations = snapshot.visited_locations
+        self.target_history = snapshot.target_history
+        self.history_shared = True
+        self.planets_in_memory = [planet.copy() for planet in snapshot.planets]
+        self.planet_memory_index = {planet['position']: planet for planet in self.planets_in_memory}
+        self.rng.setstate(snapshot.rng_state)
+        self.path_cache.restore(snapshot.path_cache)
+        field_state, self.station_field_monsters, station_field_changes = snapshot.station_field
+        self.station_field.restore(field_state)
+        self.station_field_changes = set(station_field_changes)
+        self.dstar, dstar_state, self.dstar_monsters, cost_changes = snapshot.dstar
+        if self.dstar is not None:
+            self.dstar.restore(dstar_state)
+        self.cost_changes = list(cost_changes)
+        self.best_candidate = None
+
+    # brings the structures built from memory that are not saved up to date after restore() swapped its cells,
+    # old_cells are the cells before; like sense, the hierarchy is told about every cell that differs
+    def memory_restored(self, old_cells):
+        changed = np.argwhere(old_cells != self.memory.cells)
+        if len(changed) == 0:
+            return
+        min_row, min_col = changed.min(axis=0).tolist()
+        max_row, max_col = changed.max(axis=0).tolist()
+        self.astar.set_cells(min_row, min_col, self.memory.cells[min_row:max_row + 1, min_col:max_col + 1])
+        self.frontier.update(self.memory, min_row, max_row, min_col, max_col)
+        
+        if self.hierarchy is not None:
+            self.hierarchy_changes.update((r, c) for r, c in changed.tolist())
+
+    # visited_locations and target_history are copied before their first change after a snapshot or restore
+    def own_history(self):
+        if self.history_shared:
+            self.visited_locations = set(self.visited_locations)
+            self.target_history = list(self.target_history)
+            self.history_shared = False
+
+    def remember_planet(self, pos, observation):
+        planet_info = observation.planet_at(pos)
+        if planet_info:
+            existing_planet = self.planet_memory_index.get(pos)
+            if existing_planet:
+                existing_planet['resource_amount'] = planet_info['resource_amount']
+                existing_planet['resource_type'] = planet_info['resource_type']
+            else:
+                planet_copy = planet_info.copy()
+                self.planets_in_memory.append(planet_copy)
+                self.planet_memory_index[pos] = planet_copy
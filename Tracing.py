@@ -0,0 +1,199 @@
+import json
+import os
+
+import numpy as np
+
+from SpaceEnvironment import ACTIONS
+
+# Binary traces of episodes
+# TraceRecorder.attach(env, seed) wraps do_action and update_env on that environment instance and writes one
+# fixed-width record per step, buffered in chunks of chunk_size records. A trace is three files:
+#   path.steps    the step records, a flat array of step_dtype(max_meteors)
+#   path.layouts  the grid of every episode right after initialize_env, an (E, H, W) int8 array
+#   path.json     grid size, max_meteors, action names and the seed, first step and number of steps of every episode,
+#                 written by close()
+# TraceReader memory maps the first two files, so queries over many episodes do not load the whole trace
+#
+# usage: python Evaluation.py --workers 1 --trace traces, then TraceReader("traces/seeds_0")
+
+# code in the step records of an action that is not in ACTIONS (None or an unknown name), do_action ignores those
+UNKNOWN_ACTION = -1
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+RESOURCES = ["water", "minerals", "oxygen"]
+
+
+# record of one step, the state after the action and the environment update
+# meteors holds the positions of the first meteor_count meteors, the other rows are -1
+def step_dtype(max_meteors):
+    return np.dtype([
+        ("episode", "<u4"),
+        ("timestep", "<u4"),
+        ("action", "i1"),
+        ("position", "<i2", (2,)),
+        ("fuel", "<i2"),
+        ("health", "<i2"),
+        ("resources", "<i2", (len(RESOURCES),)),
+        ("coverage", "<f4"),
+        ("meteor_count", "u1"),
+        ("meteors", "<i2", (max_meteors, 2)),
+    ])
+
+
+class TraceRecorder:
+    def __init__(self, path, max_meteors=16, chunk_size=4096):
+        self.path = path
+        self.max_meteors = max_meteors
+        self.dtype = step_dtype(max_meteors)
+        self.buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self.buffered = 0
+        self.grid_size = None
+        self.episodes = []
+        self.steps = 0
+        self.env = None
+        # step of the last do_action, written once update_env ran or the next action came
+        self.pending = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.steps_file = open(path + ".steps", "wb")
+        self.layouts_file = open(path + ".layouts", "wb")
+
+    # starts a new episode on env, call it after env.initialize_env
+    def attach(self, env, seed=None):
+        self.detach()
+        grid_size = tuple(env.grid.shape)
+        if self.grid_size is None:
+            self.grid_size = grid_size
+        elif grid_size != self.grid_size:
+            raise ValueError(f"grid {grid_size} does not match the {self.grid_size} grid of the trace")
+        if len(env.meteors) > self.max_meteors:
+            raise ValueError(f"{len(env.meteors)} meteors do not fit in max_meteors={self.max_meteors}")
+
+        env.grid.astype(np.int8).tofile(self.layouts_file)
+        self.episodes.append({"seed": seed, "start": self.steps, "steps": 0,
+                              "start_position": env.starting_position, "end_position": env.end_position})
+        self.env = env
+        do_action, update_env = env.do_action, env.update_env
+
+        # the instance attributes hide the class methods until detach removes them
+        def traced_do_action(agent_state, action):
+            self.write_pending()
+            result = do_action(agent_state, action)
+            self.pending = (env.timestep, action, result["agent_state"])
+            return result
+
+        def traced_update_env(agent_state):
+            update_env(agent_state)
+            self.write_pending()
+
+        env.do_action = traced_do_action
+        env.update_env = traced_update_env
+
+    # ends the episode, the environment runs its plain methods again
+    def detach(self):
+        if self.env is None:
+            return
+        self.write_pending()
+        self.env.__dict__.pop("do_action", None)
+        self.env.__dict__.pop("update_env", None)
+        self.env = None
+        self.flush()
+
+    def write_pending(self):
+        if self.pending is None:
+            return
+        timestep, action, agent_state = self.pending
+        self.pending = None
+
+        record = self.buffer[self.buffered]
+        record["episode"] = len(self.episodes) - 1
+        record["timestep"] = timestep
+        record["action"] = ACTION_CODES.get(action, UNKNOWN_ACTION)
+        record["position"] = agent_state["position"]
+        record["fuel"] = agent_state["fuel"]
+        record["health"] = agent_state["health"]
+        record["resources"] = [agent_state["collected_resources"][resource] for resource in RESOURCES]
+        record["coverage"] = agent_state["covered_map_percentage"]
+        meteors = record["meteors"]
+        meteors[:] = -1
+        record["meteor_count"] = len(self.env.meteors)
+        for i, meteor in enumerate(self.env.meteors):
+            meteors[i] = meteor["position"]
+
+        self.buffered += 1
+        self.steps += 1
+        self.episodes[-1]["steps"] += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    # writes the buffered records to the steps file
+    def flush(self):
+        self.buffer[:self.buffered].tofile(self.steps_file)
+        self.buffered = 0
+        self.steps_file.flush()
+        self.layouts_file.flush()
+
+    # the sidecar is only written once, by close()
+    def write_sidecar(self):
+        meta = {
+            "grid": self.grid_size,
+            "max_meteors": self.max_meteors,
+            "actions": ACTIONS,
+            "resources": RESOURCES,
+            "steps": self.steps,
+            "episodes": self.episodes,
+        }
+        with open(self.path + ".json", "w") as f:
+            json.dump(meta, f)
+
+    def close(self):
+        self.detach()
+        self.write_sidecar()
+        self.steps_file.close()
+        self.layouts_file.close()
+
+
+# Read-only view of a trace written by TraceRecorder
+# steps is the memory mapped record array and layouts the memory mapped (E, H, W) grids,
+# both are only read from disk where they are indexed, episodes is the per episode metadata of the sidecar
+class TraceReader:
+    def __init__(self, path):
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        self.path = path
+        self.grid_size = tuple(meta["grid"]) if meta["grid"] else (0, 0)
+        self.actions = meta["actions"]
+        self.resources = meta["resources"]
+        self.episodes = meta["episodes"]
+        self.dtype = step_dtype(meta["max_meteors"])
+
+        # np.memmap refuses empty files
+        if meta["steps"]:
+            self.steps = np.memmap(path + ".steps", dtype=self.dtype, mode="r", shape=(meta["steps"],))
+        else:
+            self.steps = np.zeros(0, dtype=self.dtype)
+        if self.episodes:
+            self.layouts = np.memmap(path + ".layouts", dtype=np.int8, mode="r",
+                                     shape=(len(self.episodes),) + self.grid_size)
+        else:
+            self.layouts = np.zeros((0,) + self.grid_size, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    # step records of episode i
+    def episode(self, i):
+        start = self.episodes[i]["start"]
+        return self.steps[start:start + self.episodes[i]["steps"]]
+
+    # action names of an array of action codes, None for UNKNOWN_ACTION
+    def action_names(self, codes):
+        # the code -1 indexes the trailing None
+        return np.array(self.actions + [None], dtype=object)[codes]
+
+
+# readers of every trace in directory, ordered by name
+def read_traces(directory):
+    names = sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+    return [TraceReader(os.path.join(directory, name)) for name in names]
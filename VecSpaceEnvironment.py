@@ -0,0 +1,364 @@
+import numpy as np
+from SpaceEnvironment import ACTIONS, ExploredCells, EMPTY, AGENT, PLANET, METEOR, SPACE_STATION, NEBULA, RADIATION_ZONE, END
+
+# Batched version of SpaceEnvironment: B episodes stepped together with NumPy.
+# Rules are the same as SpaceEnvironment, only the storage changes:
+# grid is a (B, H, W) array and every entity list becomes an array with a leading batch axis.
+#
+# agent state is kept as arrays instead of one dict per episode
+# position (B, 2), fuel (B,), health (B,), collected_resources (B, 3) in RESOURCE_TYPES order,
+# explored (B, H, W) bool, covered_map_percentage (B,)
+# get_agent_state(b) returns the same dict as SpaceEnvironment's agent_state for one episode
+#
+# actions are ints, ACTIONS[i] is the SpaceEnvironment name of action i
+# an action of -1 means "do nothing" for that episode (used for finished episodes)
+
+SCAN, UP, DOWN, LEFT, RIGHT, COLLECT, DOCK = range(len(ACTIONS))
+ACTION_IDS = {name: i for i, name in enumerate(ACTIONS)}
+
+RESOURCE_TYPES = ["water", "minerals", "oxygen"]
+# order used by SpaceEnvironment when picking a planet resource
+PLANET_RESOURCES = [RESOURCE_TYPES.index(r) for r in ["water", "oxygen", "minerals"]]
+
+# row/col offsets of UP, DOWN, LEFT, RIGHT
+MOVE_DELTAS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+SENSOR_RANGE = 3
+PATTERN_LENGTH = 5
+
+
+class VecSpaceEnvironment:
+    def __init__(self, num_envs, grid=(20,20), seed=None):
+        self.num_envs = num_envs
+        self.grid_size = grid
+        self.rng = np.random.default_rng(seed)
+        self.grid = np.full((num_envs,) + tuple(grid), EMPTY, dtype=np.int8)
+        self.occupied = np.zeros((num_envs,) + tuple(grid), dtype=bool)
+        self.batch = np.arange(num_envs)
+
+        # game info
+        self.timestep = np.zeros(num_envs, dtype=np.int64)
+        self.starting_position = None
+        self.end_position = None
+
+        # goals
+        self.resource_goals = {}
+        self.resource_goal_array = np.zeros(len(RESOURCE_TYPES), dtype=np.int64)
+        self.mapping_goal_percentage = 0.0
+
+    def initialize_env(self, num_planets=4,
+                      num_meteors=5,
+                      num_space_stations=2,
+                      num_nebulas=2,
+                      num_radiation_zones=2,
+                      mapping_goal_percentage=70.0,
+                      resource_goals=None,
+                      seed=None):
+        # reseed, so the same seed always gives the same batch
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+
+        B = self.num_envs
+        H, W = self.grid_size
+        total = 2 + num_planets + num_meteors + num_nebulas + num_radiation_zones + num_space_stations
+        if total > H * W:
+            raise ValueError(f"cannot place {total} entities on a {H}x{W} grid")
+
+        # distinct random cells per episode, in random order
+        keys = self.rng.random((B, H * W))
+        cells = np.argpartition(keys, total - 1, axis=1)[:, :total]
+        cells = self.rng.permuted(cells, axis=1)
+        positions = np.stack(np.divmod(cells, W), axis=-1)
+
+        counts = [1, 1, num_planets, num_meteors, num_nebulas, num_radiation_zones, num_space_stations]
+        start, end, planets, meteors, nebulas, radiation, stations = np.split(positions, np.cumsum(counts)[:-1], axis=1)
+
+        self.starting_position = start[:, 0].copy()
+        self.end_position = end[:, 0].copy()
+        self.planet_positions = planets.copy()
+        self.planet_resources = np.array(PLANET_RESOURCES)[self.rng.integers(0, 3, (B, num_planets))]
+        self.planet_amounts = self.rng.integers(5, 21, (B, num_planets))
+        self.meteor_positions = meteors.copy()
+        self.meteor_damage = self.rng.integers(5, 16, (B, num_meteors))
+        self.meteor_patterns = self.rng.integers(0, 4, (B, num_meteors, PATTERN_LENGTH))
+        self.meteor_pattern_i = np.zeros((B, num_meteors), dtype=np.int64)
+        self.station_positions = stations.copy()
+        self.station_refuel = np.full((B, num_space_stations), 70)
+
+        # nebulas can spawn at runtime, so they are kept as a per cell count
+        self.nebula_count = np.zeros((B, H, W), dtype=np.int16)
+        # radiation zones never move, so their damage is kept as a per cell map
+        self.radiation_damage = np.zeros((B, H, W), dtype=np.int16)
+
+        self.grid[:] = EMPTY
+        self.occupied[:] = False
+        self.timestep[:] = 0
+        b = self.batch[:, None]
+        for pos, entity in [(start, AGENT), (end, END), (planets, PLANET), (meteors, METEOR),
+                            (nebulas, NEBULA), (radiation, RADIATION_ZONE), (stations, SPACE_STATION)]:
+            self.grid[b, pos[..., 0], pos[..., 1]] = entity
+            self.occupied[b, pos[..., 0], pos[..., 1]] = True
+        self.nebula_count[b, nebulas[..., 0], nebulas[..., 1]] += 1
+        self.radiation_damage[b, radiation[..., 0], radiation[..., 1]] += 2
+
+        # goals
+        self.mapping_goal_percentage = mapping_goal_percentage
+        self.resource_goals = resource_goals or {"water":10, "minerals": 15, "oxygen": 5}
+        self.resource_goal_array = np.array([self.resource_goals.get(r, 0) for r in RESOURCE_TYPES])
+
+        self.reset_agents()
+
+    # build a batch from already initialized SpaceEnvironments
+    # useful to check the vectorized rules against the single world ones
+    @classmethod
+    def from_envs(cls, envs, seed=None):
+        vec = cls(len(envs), grid=envs[0].grid_size, seed=seed)
+        B = len(envs)
+        H, W = vec.grid_size
+        num_planets = len(envs[0].planets)
+        num_meteors = len(envs[0].meteors)
+        num_stations = len(envs[0].space_stations)
+        for env in envs:
+            if env.grid_size != vec.grid_size or len(env.planets) != num_planets \
+                    or len(env.meteors) != num_meteors or len(env.space_stations) != num_stations:
+                raise ValueError("all environments must have the same grid size and entity counts")
+
+        vec.grid[:] = np.stack([env.grid for env in envs])
+        vec.occupied[:] = False
+        vec.nebula_count = np.zeros((B, H, W), dtype=np.int16)
+        vec.radiation_damage = np.zeros((B, H, W), dtype=np.int16)
+        vec.starting_position = np.array([env.starting_position for env in envs])
+        vec.end_position = np.array([env.end_position for env in envs])
+        vec.planet_positions = np.array([[p["position"] for p in env.planets] for env in envs]).reshape(B, num_planets, 2)
+        vec.planet_resources = np.array([[RESOURCE_TYPES.index(p["resource_type"]) for p in env.planets] for env in envs]).reshape(B, num_planets)
+        vec.planet_amounts = np.array([[p["resource_amount"] for p in env.planets] for env in envs]).reshape(B, num_planets)
+        vec.meteor_positions = np.array([[m["position"] for m in env.meteors] for env in envs]).reshape(B, num_meteors, 2)
+        vec.meteor_damage = np.array([[m["damage"] for m in env.meteors] for env in envs]).reshape(B, num_meteors)
+        directions = ["UP", "DOWN", "LEFT", "RIGHT"]
+        vec.meteor_patterns = np.array([[[directions.index(d) for d in m["movement_pattern"]] for m in env.meteors] for env in envs]).reshape(B, num_meteors, -1)
+        vec.meteor_pattern_i = np.array([[m["pattern_i"] for m in env.meteors] for env in envs]).reshape(B, num_meteors)
+        vec.station_positions = np.array([[s["position"] for s in env.space_stations] for env in envs]).reshape(B, num_stations, 2)
+        vec.station_refuel = np.array([[s["refuel_amount"] for s in env.space_stations] for env in envs]).reshape(B, num_stations)
+        for b, env in enumerate(envs):
+            for pos in env.occupied_positions:
+                vec.occupied[(b,) + pos] = True
+            for nebula in env.nebulas:
+                vec.nebula_count[(b,) + nebula["position"]] += nebula["sensor_reduction"]
+            for radiation_zone in env.radiation_zones:
+                vec.radiation_damage[(b,) + radiation_zone["position"]] += radiation_zone["damage"]
+            vec.timestep[b] = env.timestep
+
+        vec.mapping_goal_percentage = envs[0].mapping_goal_percentage
+        vec.resource_goals = envs[0].resource_goals
+        vec.resource_goal_array = np.array([vec.resource_goals.get(r, 0) for r in RESOURCE_TYPES])
+        vec.reset_agents()
+        return vec
+
+    # same initial agent_state as main.py and gui.py
+    def reset_agents(self, fuel=100, health=100):
+        B = self.num_envs
+        self.position = self.starting_position.copy()
+        self.fuel = np.full(B, fuel, dtype=np.int64)
+        self.health = np.full(B, health, dtype=np.int64)
+        self.collected_resources = np.zeros((B, len(RESOURCE_TYPES)), dtype=np.int64)
+        self.explored = np.zeros_like(self.occupied)
+        self.explored[self.batch, self.position[:, 0], self.position[:, 1]] = True
+        self.explored_count = np.ones(B, dtype=np.int64)
+        self.covered_map_percentage = np.zeros(B)
+
+    # agent_state dict of one episode, same format as SpaceEnvironment
+    def get_agent_state(self, b):
+        return {
+            "position": tuple(int(x) for x in self.position[b]),
+            "fuel": int(self.fuel[b]),
+            "health": int(self.health[b]),
+            "collected_resources": {r: int(self.collected_resources[b, i]) for i, r in enumerate(RESOURCE_TYPES)},
+            "covered_map_percentage": float(self.covered_map_percentage[b]),
+            "explored_cells": ExploredCells.from_mask(self.explored[b]),
+        }
+
+    # ACTION FUNCTIONS
+
+    def _at_position(self, positions):
+        # (B, K) mask of entities that are on the agent's cell
+        return (positions == self.position[:, None, :]).all(axis=-1)
+
+    # (B, len(ACTIONS)) mask of allowed actions, same rules as SpaceEnvironment.actions
+    def allowed_actions(self):
+        B = self.num_envs
+        H, W = self.grid_size
+        allowed = np.zeros((B, len(ACTIONS)), dtype=bool)
+        allowed[:, SCAN] = True
+        # with no health or no fuel only scan is allowed
+        can_act = (self.health > 0) & (self.fuel > 0)
+
+        new_positions = self.position[:, None, :] + MOVE_DELTAS[None, :, :]
+        in_bounds = ((new_positions >= 0) & (new_positions < np.array([H, W]))).all(axis=-1)
+        allowed[:, UP:RIGHT + 1] = in_bounds & can_act[:, None]
+        allowed[:, COLLECT] = self._at_position(self.planet_positions).any(axis=1) & can_act
+        allowed[:, DOCK] = self._at_position(self.station_positions).any(axis=1) & can_act
+        return allowed
+
+    # list of allowed action names for one episode
+    def actions(self, b):
+        return [ACTIONS[i] for i in np.flatnonzero(self.allowed_actions()[b])]
+
+    # result function
+    # actions is a (B,) array of action ids (or names)
+    # returns {"scan": scan, "scanned": scanned}
+    # scan is a (B, 7, 7) array of the grid around each agent (row, col at [3, 3]),
+    # scanned masks the cells that were actually scanned this step
+    # this is the same information as the SCAN percepts of SpaceEnvironment
+    def do_action(self, actions):
+        actions = np.asarray([ACTION_IDS.get(a, -1) if isinstance(a, str) else a for a in actions]
+                             if not isinstance(actions, np.ndarray) else actions)
+        B = self.num_envs
+        H, W = self.grid_size
+        allowed = self.allowed_actions()
+        valid = actions >= 0
+        valid[valid] = allowed[self.batch[valid], actions[valid]]
+
+        # moves
+        move = valid & (actions >= UP) & (actions <= RIGHT)
+        if move.any():
+            b = self.batch[move]
+            old = self.position[move]
+            new = old + MOVE_DELTAS[actions[move] - UP]
+            self.occupied[b, old[:, 0], old[:, 1]] = False
+            self.grid[b, old[:, 0], old[:, 1]] = EMPTY
+            self.grid[b, new[:, 0], new[:, 1]] = AGENT
+            self.occupied[b, new[:, 0], new[:, 1]] = True
+            self.position[move] = new
+
+            newly_explored = ~self.explored[b, new[:, 0], new[:, 1]]
+            self.explored[b, new[:, 0], new[:, 1]] = True
+            self.explored_count[move] += newly_explored
+
+            self.fuel[move] -= 1
+
+            # meteors and radiation zones on the new cell
+            meteor_hits = (self.meteor_positions[move] == new[:, None, :]).all(axis=-1)
+            self.health[move] -= (meteor_hits * self.meteor_damage[move]).sum(axis=1)
+            self.health[move] -= self.radiation_damage[b, new[:, 0], new[:, 1]]
+
+        # scans
+        scan = np.full((B, 2 * SENSOR_RANGE + 1, 2 * SENSOR_RANGE + 1), -1, dtype=np.int8)
+        scanned = np.zeros(scan.shape, dtype=bool)
+        do_scan = valid & (actions == SCAN)
+        if do_scan.any():
+            b = self.batch[do_scan]
+            pos = self.position[do_scan]
+            sensor_range = SENSOR_RANGE - self.nebula_count[b, pos[:, 0], pos[:, 1]]
+            offsets = np.arange(-SENSOR_RANGE, SENSOR_RANGE + 1)
+            rows = pos[:, 0, None, None] + offsets[None, :, None]
+            cols = pos[:, 1, None, None] + offsets[None, None, :]
+            in_range = (np.abs(offsets)[None, :, None] <= sensor_range[:, None, None]) \
+                & (np.abs(offsets)[None, None, :] <= sensor_range[:, None, None])
+            mask = in_range & (rows >= 0) & (rows < H) & (cols >= 0) & (cols < W)
+
+            k, i, j = np.nonzero(mask)
+            eb, er, ec = b[k], rows[k, i, 0], cols[k, 0, j]
+            window = np.full(mask.shape, -1, dtype=np.int8)
+            window[k, i, j] = self.grid[eb, er, ec]
+            scan[do_scan] = window
+            scanned[do_scan] = mask
+
+            newly_explored = ~self.explored[eb, er, ec]
+            self.explored[eb, er, ec] = True
+            self.explored_count += np.bincount(eb, weights=newly_explored, minlength=B).astype(np.int64)
+
+        # collect
+        collect = valid & (actions == COLLECT)
+        if collect.any():
+            b = self.batch[collect]
+            # first planet on the agent's cell
+            planet = self._at_position(self.planet_positions)[collect].argmax(axis=1)
+            resource = self.planet_resources[b, planet]
+            np.add.at(self.collected_resources, (b, resource), self.planet_amounts[b, planet])
+            self.planet_amounts[b, planet] = 0
+
+        # dock
+        dock = valid & (actions == DOCK)
+        if dock.any():
+            on_station = self._at_position(self.station_positions)[dock]
+            refuel = (on_station * self.station_refuel[dock]).max(axis=1)
+            self.fuel[dock] = np.minimum(self.fuel[dock] + refuel, 100)
+
+        # covered map percentage only changes on moves and scans
+        explore = move | do_scan
+        self.covered_map_percentage[explore] = self.explored_count[explore] / (H * W) * 100
+        return {"scan": scan, "scanned": scanned}
+
+    # UPDATE ENVIRONMENT FUNCTIONS
+
+    # active masks the episodes to update, by default all of them
+    def update_env(self, active=None, directions=None):
+        if active is None:
+            active = np.ones(self.num_envs, dtype=bool)
+        self.timestep[active] += 1
+        self.move_meteors(active, directions)
+        self.add_nebula(active)
+
+    # directions is an optional (B, M) array of direction ids (index into MOVE_DELTAS),
+    # random directions are drawn when it is not given
+    def move_meteors(self, active=None, directions=None):
+        if active is None:
+            active = np.ones(self.num_envs, dtype=bool)
+        B = self.num_envs
+        H, W = self.grid_size
+        num_meteors = self.meteor_positions.shape[1]
+        if directions is None:
+            directions = self.rng.integers(0, 4, (B, num_meteors))
+
+        # meteors of one episode move one after the other like in SpaceEnvironment,
+        # all episodes move together
+        for m in range(num_meteors):
+            old = self.meteor_positions[:, m]
+            new = old + MOVE_DELTAS[directions[:, m]]
+            in_bounds = (new[:, 0] >= 0) & (new[:, 0] < H) & (new[:, 1] >= 0) & (new[:, 1] < W)
+            r = np.clip(new[:, 0], 0, H - 1)
+            c = np.clip(new[:, 1], 0, W - 1)
+            on_agent = (new == self.position).all(axis=1)
+            move = active & in_bounds & (~self.occupied[self.batch, r, c] | on_agent)
+
+            b = self.batch[move]
+            self.occupied[b, old[move, 0], old[move, 1]] = False
+            # like SpaceEnvironment only the old cell of the grid is cleared
+            self.grid[b, old[move, 0], old[move, 1]] = EMPTY
+            self.meteor_positions[move, m] = new[move]
+            self.occupied[b, r[move], c[move]] = True
+
+            # collision
+            hit = move & on_agent
+            self.health[hit] -= self.meteor_damage[hit, m]
+
+    def add_nebula(self, active=None):
+        if active is None:
+            active = np.ones(self.num_envs, dtype=bool)
+        # 2% chance to generate a nebula
+        spawn = active & (self.rng.random(self.num_envs) < 0.02)
+        # a full grid has no room for a new nebula
+        free = ~self.occupied.reshape(self.num_envs, -1)
+        spawn &= free.any(axis=1)
+        if not spawn.any():
+            return
+        b = self.batch[spawn]
+        # random empty cell per episode
+        keys = np.where(free[spawn], self.rng.random(free[spawn].shape), -1.0)
+        r, c = np.divmod(keys.argmax(axis=1), self.grid_size[1])
+        self.grid[b, r, c] = NEBULA
+        self.nebula_count[b, r, c] += 1
+        self.occupied[b, r, c] = True
+
+    # GOAL FUNCTION
+    # returns dic of (B,) arrays {is_game_over, is_map_covered, is_resources_met}
+    def is_game_over(self):
+        r, c = self.position[:, 0], self.position[:, 1]
+        is_over = self.health <= 0
+        is_over |= (self.fuel <= 0) & (self.grid[self.batch, r, c] != SPACE_STATION)
+        is_over |= (self.position == self.end_position).all(axis=1)
+
+        is_map_covered = self.covered_map_percentage >= self.mapping_goal_percentage
+        is_resources_met = (self.collected_resources >= self.resource_goal_array).all(axis=1)
+
+        return {"is_game_over": is_over, "is_map_covered": is_map_covered, "is_resources_met": is_resources_met}
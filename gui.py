@@ -21,10 +21,11 @@ ORANGE = (255, 165, 0)
 DARK_BLUE = (25, 25, 112)
 
 # Game settings
+# (rows, cols), the grid is drawn cols wide and rows high
 GRID_SIZE = (20, 20)
 CELL_SIZE = 30
-SCREEN_WIDTH = GRID_SIZE[0] * CELL_SIZE + 300  # Wider info panel for agent info
-SCREEN_HEIGHT = GRID_SIZE[1] * CELL_SIZE
+SCREEN_WIDTH = GRID_SIZE[1] * CELL_SIZE + 300  # Wider info panel for agent info
+SCREEN_HEIGHT = GRID_SIZE[0] * CELL_SIZE
 
 # Set up display
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -36,7 +37,7 @@ font = pygame.font.SysFont("Arial", 16)
 
 class AutoSpaceGUI:
     def __init__(self):
-        self.env = SpaceEnvironment(grid=GRID_SIZE)
+        self.env = SpaceEnvironment(grid=GRID_SIZE, percept_mode="array")
         self.running = True
         self.auto_play = False
         self.step_delay = 0.2  # Time between steps in seconds
@@ -48,14 +49,7 @@ class AutoSpaceGUI:
         
     def reset_game(self):
         self.env.initialize_env()
-        self.agent_state = {
-            "position": self.env.starting_position,
-            "fuel": 100,
-            "health": 100,
-            "collected_resources": {"water": 0, "minerals": 0, "oxygen": 0},
-            "explored_cells": {self.env.starting_position},
-            "covered_map_percentage": 0.0
-        }
+        self.agent_state = self.env.initial_agent_state()
         
         # Initialize the intelligent agent
         initial_agent_info = {
@@ -63,20 +57,17 @@ class AutoSpaceGUI:
         }        
             
         # Create the agent
-        self.agent = Agent(initial_agent_info, self.env.grid_size[0], 
+        self.agent = Agent(initial_agent_info, self.env.grid_size, 
                          location=self.env.starting_position)
                           
+        # The agent reads its state and the environment through this view
+        self.observation = self.env.observation(self.agent_state)
+                          
         # Do an initial scan to build the agent's knowledge
         result = self.env.do_action(self.agent_state, "SCAN")
         self.agent_state = result["agent_state"]
         percepts = result["percepts"]
-        self.agent.sense(self.agent_state["position"], self.env)
-        
-        # Sync agent properties with agent_state
-        self.agent.location = self.agent_state["position"]
-        self.agent.fuel = self.agent_state["fuel"]
-        self.agent.health = self.agent_state["health"]
-        self.agent.resources = self.agent_state["collected_resources"].copy()
+        self.agent.sense(self.agent_state["position"], self.observation, percepts)
         
         self.last_health = 100  # Track health changes
         self.game_over = False
@@ -86,33 +77,33 @@ class AutoSpaceGUI:
         
     def draw_grid(self):
         # Draw background
-        grid_area = pygame.Rect(0, 0, GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE)
+        grid_area = pygame.Rect(0, 0, GRID_SIZE[1] * CELL_SIZE, GRID_SIZE[0] * CELL_SIZE)
         pygame.draw.rect(screen, DARK_BLUE, grid_area)
         
         # Draw damage flash effect
         if self.damage_flash > 0:
             # Create a semi-transparent red overlay when taking damage
-            damage_surface = pygame.Surface((GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE), pygame.SRCALPHA)
+            damage_surface = pygame.Surface((GRID_SIZE[1] * CELL_SIZE, GRID_SIZE[0] * CELL_SIZE), pygame.SRCALPHA)
             flash_alpha = min(120, self.damage_flash * 4)  # Max 120 alpha, fading out
             damage_surface.fill((255, 0, 0, flash_alpha))  # Red with alpha
             screen.blit(damage_surface, (0, 0))
             self.damage_flash -= 1
         
         # Draw grid lines
-        for x in range(0, GRID_SIZE[0] * CELL_SIZE + 1, CELL_SIZE):
-            pygame.draw.line(screen, WHITE, (x, 0), (x, GRID_SIZE[1] * CELL_SIZE), 1)
-        for y in range(0, GRID_SIZE[1] * CELL_SIZE + 1, CELL_SIZE):
-            pygame.draw.line(screen, WHITE, (0, y), (GRID_SIZE[0] * CELL_SIZE, y), 1)
+        for x in range(0, GRID_SIZE[1] * CELL_SIZE + 1, CELL_SIZE):
+            pygame.draw.line(screen, WHITE, (x, 0), (x, GRID_SIZE[0] * CELL_SIZE), 1)
+        for y in range(0, GRID_SIZE[0] * CELL_SIZE + 1, CELL_SIZE):
+            pygame.draw.line(screen, WHITE, (0, y), (GRID_SIZE[1] * CELL_SIZE, y), 1)
         
         # Draw entities
+        explored = self.agent_state["explored_cells"].mask
         for row in range(GRID_SIZE[0]):
             for col in range(GRID_SIZE[1]):
                 entity = self.env.grid[row, col]
                 x = col * CELL_SIZE
                 y = row * CELL_SIZE
                 
-                pos = (row, col)
-                if pos in self.agent_state["explored_cells"]:
+                if explored[row, col]:
                     if entity == EMPTY:
                         pass  # Empty space
                     elif entity == AGENT:
@@ -183,7 +174,7 @@ class AutoSpaceGUI:
     
     def draw_info(self):
         # Info panel position
-        panel_x = GRID_SIZE[0] * CELL_SIZE
+        panel_x = GRID_SIZE[1] * CELL_SIZE
         
         # Draw panel background
         panel_rect = pygame.Rect(panel_x, 0, 300, SCREEN_HEIGHT)
@@ -299,7 +290,7 @@ class AutoSpaceGUI:
         
         # Update agent's memory if we got percepts
         if percepts:
-            self.agent.sense(self.agent_state["position"], self.env)
+            self.agent.sense(self.agent_state["position"], self.observation, percepts)
             
         
         self.env.update_env(self.agent_state)
@@ -319,14 +310,8 @@ class AutoSpaceGUI:
         if not self.game_over:
             allowed_actions = self.env.actions(self.agent_state)
             
-            # Update agent properties from agent_state
-            self.agent.location = self.agent_state["position"]
-            self.agent.fuel = self.agent_state["fuel"]
-            self.agent.health = self.agent_state["health"]
-            self.agent.resources = self.agent_state["collected_resources"].copy()
-            
             # Use the intelligent agent to choose an action
-            action = self.agent.choose_action(self.env, allowed_actions)
+            action = self.agent.choose_action(self.observation, allowed_actions)
             self.perform_action(action)
     
     def run(self):
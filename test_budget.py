@@ -0,0 +1,60 @@
+import gc
+import time
+
+import pytest
+
+from SpaceEnvironment import SpaceEnvironment
+from Spacecraft import Agent
+
+# choose_action(..., budget_ms) has to return within the budget, wherever planning is when the time runs out
+# the machine can stall any call for longer than a millisecond, so a call over the budget is tried again from a
+# snapshot of the agent taken before it and only the fastest try has to fit
+# run with: python -m pytest -q test_budget.py
+
+STEPS = 150
+TRIES = 5
+
+
+def timed_choice(agent, observation, allowed_actions, budget_ms):
+    start = time.perf_counter()
+    action = agent.choose_action(observation, allowed_actions, budget_ms)
+    return action, (time.perf_counter() - start) * 1000
+
+
+@pytest.mark.parametrize("planner", ["astar", "dstar", "hierarchical"])
+@pytest.mark.parametrize("grid, budget_ms, seed", [((20, 20), 1, 0), ((200, 200), 1, 3), ((200, 200), 2, 3)])
+def test_choose_action_returns_within_budget(planner, grid, budget_ms, seed):
+    env = SpaceEnvironment(grid=grid, percept_mode="array", seed=seed)
+    env.initialize_env(num_meteors=grid[0] * grid[1] // 40)
+    agent_state = env.initial_agent_state()
+    agent = Agent({'resource_goals': env.resource_goals}, env.grid_size, location=env.starting_position, seed=seed,
+                  planner=planner)
+    observation = env.observation(agent_state)
+    result = env.do_action(agent_state, "SCAN")
+    agent.sense(agent_state["position"], observation, result["percepts"])
+
+    fallbacks = 0
+    gc.disable()
+    try:
+        for _ in range(STEPS):
+            if env.is_game_over(agent_state)["is_game_over"]:
+                break
+            allowed_actions = env.actions(agent_state)
+            before = agent.snapshot()
+            action, elapsed = timed_choice(agent, observation, allowed_actions, budget_ms)
+            for _ in range(TRIES - 1):
+                if elapsed <= budget_ms:
+                    break
+                agent.restore(before)
+                action, elapsed = timed_choice(agent, observation, allowed_actions, budget_ms)
+            assert elapsed <= budget_ms, f"{elapsed:.3f} ms at step {env.timestep}, {agent.last_decision_reason}"
+            fallbacks += agent.last_fallback is not None
+
+            result = env.do_action(agent_state, action)
+            if result["percepts"]:
+                agent.sense(agent_state["position"], observation, result["percepts"])
+            env.update_env(agent_state)
+    finally:
+        gc.enable()
+    # the budget was tight enough to matter
+    assert fallbacks
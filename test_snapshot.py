@@ -0,0 +1,117 @@
+import copy
+import pickle
+
+import pytest
+
+from SpaceEnvironment import SpaceEnvironment, HAZARD_TYPES, EMPTY, METEOR
+from Spacecraft import Agent
+
+# Restoring SpaceEnvironment.snapshot() and Agent.snapshot() has to continue the episode exactly like it went on
+# the first time: the steps after the snapshot are recorded, then replayed twice from the same snapshot
+# run with: python -m pytest -q test_snapshot.py
+
+CONTINUATION = 250
+
+
+def new_episode(seed, planner):
+    env = SpaceEnvironment(grid=(20, 30), percept_mode="array", seed=seed)
+    env.initialize_env(num_meteors=12)
+    agent_state = env.initial_agent_state()
+    agent = Agent({'resource_goals': env.resource_goals}, env.grid_size, location=env.starting_position, seed=seed,
+                  planner=planner)
+    observation = env.observation(agent_state)
+    result = env.do_action(agent_state, "SCAN")
+    agent.sense(agent_state["position"], observation, result["percepts"])
+    return env, agent, agent_state, observation
+
+
+def step(env, agent, agent_state, observation):
+    action = agent.choose_action(observation, env.actions(agent_state))
+    result = env.do_action(agent_state, action)
+    if result["percepts"]:
+        agent.sense(agent_state["position"], observation, result["percepts"])
+    env.update_env(agent_state)
+    return (action, agent_state["position"], agent_state["fuel"], agent_state["health"],
+            dict(agent_state["collected_resources"]), agent.current_target,
+            tuple(meteor["position"] for meteor in env.meteors), len(env.nebulas))
+
+
+def play(env, agent, agent_state, observation, steps):
+    trajectory = []
+    for _ in range(steps):
+        if env.is_game_over(agent_state)["is_game_over"]:
+            break
+        trajectory.append(step(env, agent, agent_state, observation))
+    return trajectory
+
+
+# the entity index and hazards match the entity lists
+def check_index(env):
+    entities = env.planets + env.meteors + env.space_stations + env.nebulas + env.radiation_zones
+    for entity_type, index in env.entity_index.items():
+        expected = sorted((entity["position"], id(entity)) for entity in entities if entity["type"] == entity_type)
+        assert sorted((pos, id(entity)) for pos, group in index.items() for entity in group) == expected
+    assert env.hazards == {entity["position"] for entity in entities if entity["type"] in HAZARD_TYPES}
+
+
+@pytest.mark.parametrize("planner", ["astar", "dstar", "hierarchical"])
+@pytest.mark.parametrize("seed, snapshot_at", [(0, 10), (1, 28), (4, 5), (9, 40)])
+def test_restore_continues_like_the_first_time(planner, seed, snapshot_at):
+    env, agent, agent_state, observation = new_episode(seed, planner)
+    play(env, agent, agent_state, observation, snapshot_at)
+    env_snapshot, agent_snapshot = env.snapshot(agent_state), agent.snapshot()
+    expected = play(env, agent, agent_state, observation, CONTINUATION)
+
+    for _ in range(2):
+        env.restore(env_snapshot, agent_state)
+        agent.restore(agent_snapshot)
+        check_index(env)
+        assert play(env, agent, agent_state, observation, CONTINUATION) == expected
+        check_index(env)
+
+
+# restore rebuilds the meteor index when most meteors moved, like after a step, and moves the few ones back otherwise
+def test_restore_after_one_meteor_moved():
+    env, agent, agent_state, observation = new_episode(0, "astar")
+    play(env, agent, agent_state, observation, 3)
+    env_snapshot = env.snapshot(agent_state)
+    meteor = env.meteors[0]
+    old_position = meteor["position"]
+    for direction in ["UP", "DOWN", "LEFT", "RIGHT"]:
+        new_position = env.get_new_position(old_position, direction)
+        if env.is_valid_position(new_position) and new_position not in env.occupied_positions:
+            break
+    env.vacate(old_position)
+    env.set_grid(old_position, EMPTY)
+    env.remove_from_index(meteor)
+    meteor["position"] = new_position
+    env.add_to_index(meteor)
+    env.occupy(new_position)
+    env.set_grid(new_position, METEOR)
+
+    env.restore(env_snapshot, agent_state)
+    assert meteor["position"] == old_position
+    assert env.entities_at(old_position, METEOR) == [meteor] and not env.entities_at(new_position, METEOR)
+    check_index(env)
+
+
+def test_restore_of_an_older_layout_fails():
+    env, agent, agent_state, observation = new_episode(0, "astar")
+    env_snapshot = env.snapshot(agent_state)
+    env.initialize_env(num_meteors=12)
+    with pytest.raises(ValueError):
+        env.restore(env_snapshot, agent_state)
+
+
+# an agent branched with deepcopy or shipped to another process with pickle plays on like the original
+@pytest.mark.parametrize("planner", ["astar", "dstar", "hierarchical"])
+@pytest.mark.parametrize("clone", [copy.deepcopy, lambda agent: pickle.loads(pickle.dumps(agent))],
+                         ids=["deepcopy", "pickle"])
+def test_copied_agent_continues_like_the_original(planner, clone):
+    env, agent, agent_state, observation = new_episode(1, planner)
+    play(env, agent, agent_state, observation, 28)
+    env_snapshot, copied = env.snapshot(agent_state), clone(agent)
+    expected = play(env, agent, agent_state, observation, CONTINUATION)
+
+    env.restore(env_snapshot, agent_state)
+    assert play(env, copied, agent_state, observation, CONTINUATION) == expected